@@ -5,32 +5,58 @@ primarily with communication to and from the API's users."""
 
 
 import endpoints
-from protorpc import messages, remote, message_types
+from datetime import date
+from protorpc import message_types, messages, remote
+from google.appengine.ext import ndb
 
 from models import (
     User,
     Word,
     Game,
-    Score
+    ArchivedGame,
+    Score,
+    Leaderboard,
+    RankerShard,
+    GlobalStatsShard,
+    LEADERBOARD_SIZE,
+    LEADERBOARD_PERIODS,
+    DIFFICULTIES,
+    add_to_word_pool,
+    period_board,
+    get_word_index
 )
 
 from models import(
     StringMessage,
     WordForm,
+    WordsForm,
+    WordImportForm,
     GameForm,
     MakeMoveForm,
+    HintForm,
+    MakeMovesForm,
+    NewGamesForm,
+    MoveForm,
+    MovesForm,
     GameForms,
+    ArchivedGameForms,
+    GameSummaryForms,
     ScoreForms,
-    RankForms
+    RankForm,
+    RankForms,
+    GlobalStatsForm
 )
 
-from utils import get_by_urlsafe
+from cache import cache_entity, uncache_entity
+from engine import is_valid_guess
+from stats import instrument
+from utils import get_by_urlsafe, get_cursor
 
 USER_REQUEST = endpoints.ResourceContainer(
     user_name=messages.StringField(1), email=messages.StringField(2))
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(
-    user_name=messages.StringField(1))
+    user_name=messages.StringField(1), difficulty=messages.StringField(2))
 
 GET_GAME_REQUEST = endpoints.ResourceContainer(
     urlsafe_key=messages.StringField(1))
@@ -38,8 +64,119 @@ GET_GAME_REQUEST = endpoints.ResourceContainer(
 MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
     MakeMoveForm, urlsafe_key=messages.StringField(1))
 
+MAKE_MOVES_REQUEST = endpoints.ResourceContainer(
+    MakeMovesForm, urlsafe_key=messages.StringField(1))
+
 HIGH_SCORE_REQUEST = endpoints.ResourceContainer(
-    number_of_results=messages.IntegerField(1))
+    number_of_results=messages.IntegerField(1),
+    period=messages.StringField(2))
+
+RANKINGS_REQUEST = endpoints.ResourceContainer(
+    page_size=messages.IntegerField(1), cursor=messages.StringField(2))
+
+ARCHIVE_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1), page_size=messages.IntegerField(2),
+    cursor=messages.StringField(3))
+
+SUMMARY_REQUEST = endpoints.ResourceContainer(
+    user_name=messages.StringField(1), completed=messages.BooleanField(2),
+    page_size=messages.IntegerField(3), cursor=messages.StringField(4))
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_NEW_GAMES = 5000
+
+
+def _play_guesses(urlsafe_key, guesses, expected_version=None):
+    """Applies valid uppercase guesses to a game in one transaction, ending
+    the game if a guess wins or loses it. If expected_version is given and
+    the game has moved past it, the request is treated as a retry when the
+    moves made since that version are the ones these guesses would make,
+    and rejected otherwise. A game that ends is recorded on the
+    leaderboards and counters after the transaction commits.
+
+    Returns:
+        The game and a MoveForm for each guess applied.
+
+    Raises:
+        endpoints.NotFoundException: if the game does not exist or has ended.
+        endpoints.ConflictException: if expected_version is stale."""
+    cached = get_by_urlsafe(urlsafe_key, Game, for_update=True)
+    if not cached:
+        raise endpoints.NotFoundException('Game Not Found')
+
+    # end_game's result, recorded once the transaction has committed
+    ended = []
+
+    def play():
+        del ended[:]
+        game = cached.key.get()
+        if game is None:
+            # Cancelled or archived since the cached copy was read
+            raise endpoints.NotFoundException('Game Not Found')
+        game._cas_client = getattr(cached, '_cas_client', None)
+        if (expected_version is not None and
+                game.version != expected_version):
+            if _is_retry(game, guesses, expected_version):
+                return game, [MoveForm(guess=guess,
+                                       message='Move already applied.')
+                              for guess in game.moves[expected_version:]]
+            raise endpoints.ConflictException(
+                'This game has changed, it is now at version %d.' %
+                game.version)
+        if game.game_over:
+            raise endpoints.NotFoundException('This Game Has Ended!')
+        start_version = game.version
+        moves = []
+        won = None
+        for guess in guesses:
+            message, won = game.play(guess)
+            moves.append(MoveForm(guess=guess, message=message))
+            if won is not None:
+                break
+        if won is not None:
+            ended.extend(game.end_game(won))
+        elif game.version != start_version:
+            game.put()
+            ndb.get_context().call_on_commit(lambda: cache_entity(game))
+        return game, moves
+    game, moves = ndb.transaction(play, xg=True)
+    if ended:
+        game.record_end(*ended)
+    return game, moves
+
+
+def _is_retry(game, guesses, expected_version):
+    """Returns True if the moves a game made after expected_version are the
+    moves the guesses would make from that version"""
+    if expected_version > game.version:
+        return False
+    seen = set(game.moves[:expected_version])
+    intended = []
+    for guess in guesses:
+        if guess not in seen:
+            seen.add(guess)
+            intended.append(guess)
+    made = list(game.moves[expected_version:])
+    return (intended[:len(made)] == made and
+            (len(made) == len(intended) or game.game_over))
+
+
+def _user_games(user_name, game_over, message):
+    """Returns GameForms of a users games that have or have not ended. The
+    user and the games are fetched at the same time.
+
+    Raises:
+        endpoints.NotFoundException: if the user is not found."""
+    user_key = User.get_key_by_name(user_name)
+    if not user_key:
+        raise endpoints.NotFoundException(
+            'A user with that name does not exist!')
+    user = user_key.get_async()
+    games = Game.query(Game.user == user_key,
+                       Game.game_over == game_over).fetch_async()
+    return Game.to_forms(games.get_result(), message,
+                         {user_key: user.get_result().name})
 
 
 @endpoints.api(name='sv_hangman', version='v1')
@@ -50,6 +187,7 @@ class SVHangmanAPI(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @instrument
     def create_user(self, request):
         """Create a user
         Args:
@@ -61,13 +199,15 @@ class SVHangmanAPI(remote.Service):
              the user has been created.
 
         Raises:
+             endpoints.BadRequestException if the name is missing or blank.
              endpoints.ConflictException if user already exists.
         """
-        if User.query(User.name == request.user_name).get():
+        if not request.user_name or not request.user_name.strip():
+            raise endpoints.BadRequestException('Please enter a user name!')
+        if (User.get_key_by_name(request.user_name) or
+                not User.create(request.user_name, request.email)):
             raise endpoints.ConflictException(
                 'A User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
         return StringMessage(message='User {} created!'.format(
             request.user_name))
 
@@ -76,31 +216,79 @@ class SVHangmanAPI(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
+    @instrument
     def new_game(self, request):
         """Creates a New Game
         Args:
              The NEW_GAME_REQUEST objects, which includes a username provided
-             by the client.
+             by the client and an optional difficulty.
 
         Returns:
              GameForm: A protorpc message representation of a 'GAME' state.
 
         Raises:
              endpoints.NotFoundException if username is invalid.
+             endpoints.BadRequestException if difficulty is not one of easy,
+             medium or hard.
         """
-        user = User.query(User.name == request.user_name).get()
-        if not user:
+        user_key = User.get_key_by_name(request.user_name)
+        if not user_key:
             raise endpoints.NotFoundException(
                 'A User with that name does not exist.')
-        game = Game.new_game(user.key)
+        if request.difficulty and request.difficulty not in DIFFICULTIES:
+            raise endpoints.BadRequestException(
+                'Difficulty must be one of: %s' % ', '.join(DIFFICULTIES))
+        # The user is only needed for its name, fetch it while the game is put
+        user = user_key.get_async()
+        game = Game.new_game(user_key, request.difficulty)
         print game.target
-        return game.to_form('Good luck playing Silicon Valley Hangman!!')
+        return game.to_form('Good luck playing Silicon Valley Hangman!!',
+                            user.get_result().name)
+
+    @endpoints.method(request_message=NewGamesForm,
+                      response_message=GameForms,
+                      path='games',
+                      name='new_games',
+                      http_method='POST')
+    @instrument
+    def new_games(self, request):
+        """Creates a New Game for each of a list of users
+        Args:
+             The NewGamesForm objects, which includes the user names, an
+             optional difficulty and whether every user gets the same word.
+
+        Returns:
+             GameForms: The new games, in the order of the user names.
+
+        Raises:
+             endpoints.BadRequestException if no or more than MAX_NEW_GAMES
+             user names are given or the difficulty is not one of easy,
+             medium or hard.
+             endpoints.NotFoundException if any username is invalid.
+        """
+        if not request.user_names or len(request.user_names) > MAX_NEW_GAMES:
+            raise endpoints.BadRequestException(
+                'Give between 1 and %d user names' % MAX_NEW_GAMES)
+        if request.difficulty and request.difficulty not in DIFFICULTIES:
+            raise endpoints.BadRequestException(
+                'Difficulty must be one of: %s' % ', '.join(DIFFICULTIES))
+        keys = User.get_keys_by_names(request.user_names)
+        unknown = sorted(name for name, key in keys.items() if not key)
+        if unknown:
+            raise endpoints.NotFoundException(
+                'No Users with the names: %s' % ', '.join(unknown))
+        user_keys = [keys[name] for name in request.user_names]
+        games = Game.new_games(user_keys, request.difficulty,
+                               request.same_word)
+        return Game.to_forms(games, 'Good luck playing Silicon Valley '
+                             'Hangman!!')
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_key}',
                       name='get_game',
                       http_method='GET')
+    @instrument
     def get_game(self, request):
         """Get the current state of a 'GAME' object
         Args:
@@ -127,74 +315,105 @@ class SVHangmanAPI(remote.Service):
                       path='game/{urlsafe_key}',
                       name='make_move',
                       http_method='PUT')
+    @instrument
     def make_move(self, request):
         """Makes a move to update/change a 'GAME' state
         Args:
-             The MAKE_MOVE_REQUEST objects, which includes a urlsafe_key and
-             a 'guess' from the client.
+             The MAKE_MOVE_REQUEST objects, which includes a urlsafe_key,
+             a 'guess' and an optional expected_version from the client.
 
         Returns:
              GameForm: A protorpc message representation of a 'GAME' state
 
         Raises:
-             endpoints.NotFoundException if game has ended.
+             endpoints.NotFoundException if game does not exist or has ended.
              endpoints.BadRequestException if 'guess' is invalid.
+             endpoints.ConflictException if expected_version is stale.
         """
-        game = get_by_urlsafe(request.urlsafe_key, Game)
         guess = request.guess.upper()
+        if not is_valid_guess(guess):
+            raise endpoints.BadRequestException('Please enter a valid guess!')
+        game, moves = _play_guesses(request.urlsafe_key, [guess],
+                                    request.expected_version)
+        return game.to_form(message=moves[0].message)
+
+    @endpoints.method(request_message=MAKE_MOVES_REQUEST,
+                      response_message=MovesForm,
+                      path='game/{urlsafe_key}/moves',
+                      name='make_moves',
+                      http_method='PUT')
+    @instrument
+    def make_moves(self, request):
+        """Makes several moves in one request
+        Args:
+             The MAKE_MOVES_REQUEST objects, which includes a urlsafe_key,
+             an ordered list of 'guesses' and an optional expected_version
+             from the client.
+
+        Returns:
+             MovesForm: the outcome of each guess and a GameForm of the final
+             'GAME' state. Guesses after the game ends are not applied.
+
+        Raises:
+             endpoints.NotFoundException if game does not exist or has ended.
+             endpoints.BadRequestException if any 'guess' is invalid.
+             endpoints.ConflictException if expected_version is stale.
+        """
+        guesses = [guess.upper() for guess in request.guesses]
+        for guess in guesses:
+            if not is_valid_guess(guess):
+                raise endpoints.BadRequestException(
+                    'Please enter a valid guess!')
+        game, moves = _play_guesses(request.urlsafe_key, guesses,
+                                    request.expected_version)
+        message = moves[-1].message if moves else 'No moves made.'
+        return MovesForm(moves=moves, game=game.to_form(message=message))
+
+    @endpoints.method(request_message=GET_GAME_REQUEST,
+                      response_message=HintForm,
+                      path='game/{urlsafe_key}/hint',
+                      name='get_hint',
+                      http_method='GET')
+    @instrument
+    def get_hint(self, request):
+        """Suggest the next guess for a game
+        Args:
+             The GET_GAME_REQUEST objects, which includes a urlsafe_key from
+             the client.
+
+        Returns:
+             HintForm: the unguessed letter found in the most words that fit
+             the answer so far and the failed tries, and the number of those
+             words. The letter is empty if no word fits.
+
+        Raises:
+             endpoints.NotFoundException if game does not exist or has ended.
+        """
+        game = get_by_urlsafe(request.urlsafe_key, Game)
+        if not game:
+            raise endpoints.NotFoundException('Game Not Found')
         if game.game_over:
             raise endpoints.NotFoundException('This Game Has Ended!')
-        if len(guess) != 1 or guess < 'A' or guess > 'Z':
-            raise endpoints.BadRequestException('Please enter a valid guess!')
-        if guess in game.failed_tries or guess in game.answer:
-            return game.to_form(message='You have already tried that!')
-        else:
-            if guess in game.target:
-                game.history.append(guess)
-                # Go through target and to add 'guess' character and remove '_'
-                for ind, tar in enumerate(game.target):
-                    if guess == tar:
-                        game.answer.pop(ind)
-                        game.answer.insert(ind, guess)
-                game.put()
-                if game.answer == game.target:
-                    game.end_game(True)
-                    return game.to_form(message="You Won!!")
-                else:
-                    return game.to_form(message="You guessed correct!")
-            else:
-                if game.attempts_remaining <= 1:
-                    game.attempts_remaining = 0
-                    game.end_game(False)
-                    return game.to_form(message="Game Over! The word was: %s"
-                                        % game.target)
-                else:
-                    game.failed_tries.append(guess)
-                    game.history.append(guess)
-                    game.attempts_remaining -= 1
-                    game.put()
-                    return game.to_form(message='Uh-Oh. Try Again.')
+        letter, candidates = get_word_index().best_letter(
+            game.answer, game.failed_tries)
+        return HintForm(letter=letter, candidates=candidates)
 
     @endpoints.method(request_message=USER_REQUEST,
                       response_message=GameForms,
                       path='games/user/{user_name}',
                       name='get_user_games',
                       http_method='GET')
+    @instrument
     def get_user_games(self, request):
         """Get all of an individual users active games"""
-        user = User.query(User.name == request.user_name).get()
-        if not user:
-            raise endpoints.NotFoundException(
-                'A user with that name does not exist!')
-        games = Game.query(Game.user == user.key, Game.game_over == False)
-        return GameForms(items=[game.to_form(message="Game In Progress")
-                         for game in games])
+        return _user_games(request.user_name, False, "Game In Progress")
 
     @endpoints.method(request_message=USER_REQUEST,
                       response_message=GameForms,
                       path='games/completed/user/{user_name}',
                       name='get_user_games_completed',
                       http_method='GET')
+    @instrument
     def get_user_games_completed(self, request):
         """Get all of an individual users completed games
         Args:
@@ -209,19 +428,84 @@ class SVHangmanAPI(remote.Service):
               endpoints.NotFoundException: if client supplied name is not
               found.
         """
-        user = User.query(User.name == request.user_name).get()
-        if not user:
+        return _user_games(request.user_name, True, "Game Complete")
+
+    @endpoints.method(request_message=SUMMARY_REQUEST,
+                      response_message=GameSummaryForms,
+                      path='games/summary/user/{user_name}',
+                      name='get_user_game_summaries',
+                      http_method='GET')
+    @instrument
+    def get_user_game_summaries(self, request):
+        """Get a page of short summaries of an individual users games
+        Args:
+             The SUMMARY_REQUEST objects, which include a user name, whether
+             to list completed games (default false), an optional page_size
+             (default 50, at most 200) and the cursor returned with the
+             previous page.
+
+        Returns:
+              GameSummaryForms: the key, attempts remaining, letters revealed
+              and status of each game with a next_cursor if there are more.
+
+        Raises:
+              endpoints.NotFoundException: if client supplied name is not
+              found.
+              endpoints.BadRequestException: if the cursor is invalid.
+        """
+        user_key = User.get_key_by_name(request.user_name)
+        if not user_key:
             raise endpoints.NotFoundException(
                 'A user with that name does not exist!')
-        games = Game.query(Game.user == user.key, Game.game_over == True)
-        return GameForms(items=[game.to_form(
-            message="Game Complete") for game in games])
+        page_size = min(request.page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        return Game.summaries(user_key, bool(request.completed), page_size,
+                              get_cursor(request.cursor))
+
+    @endpoints.method(request_message=ARCHIVE_REQUEST,
+                      response_message=ArchivedGameForms,
+                      path='games/archived/user/{user_name}',
+                      name='get_user_games_archived',
+                      http_method='GET')
+    @instrument
+    def get_user_games_archived(self, request):
+        """Get a page of an individual users archived games, newest first
+        Args:
+             The ARCHIVE_REQUEST objects, which include a user name, an
+             optional page_size (default 50, at most 200) and the cursor
+             returned with the previous page.
+
+        Returns:
+              ArchivedGameForms: the archived games with a next_cursor if
+              there are more.
+
+        Raises:
+              endpoints.NotFoundException: if client supplied name is not
+              found.
+              endpoints.BadRequestException: if the cursor is invalid.
+        """
+        user_key = User.get_key_by_name(request.user_name)
+        if not user_key:
+            raise endpoints.NotFoundException(
+                'A user with that name does not exist!')
+        page_size = min(request.page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        user = user_key.get_async()
+        page = ArchivedGame.query(ArchivedGame.user == user_key).order(
+            -ArchivedGame.ended).fetch_page_async(
+                page_size, start_cursor=get_cursor(request.cursor))
+        games, next_cursor, more = page.get_result()
+        name = user.get_result().name
+        forms = ArchivedGameForms(items=[game.to_form(name)
+                                         for game in games])
+        if more and next_cursor:
+            forms.next_cursor = next_cursor.urlsafe()
+        return forms
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=StringMessage,
                       path='game/{urlsafe_key}/cancel',
                       name='cancel_game',
                       http_method='DELETE')
+    @instrument
     def cancel_game(self, request):
         """Cancels existing game if game has NOT ended.
         Args:
@@ -236,9 +520,10 @@ class SVHangmanAPI(remote.Service):
              endpoints.BadRequestException: if game has ended.
              endpoints.NotFoundException: if urlsafe_key does not exist.
         """
-        game = get_by_urlsafe(request.urlsafe_key, Game)
+        game = get_by_urlsafe(request.urlsafe_key, Game, for_update=True)
         if game and not game.game_over:
             game.key.delete()
+            uncache_entity(game.key)
             return StringMessage(message='Game with key: {} deleted.'.
                                  format(request.urlsafe_key))
         elif game and game.game_over:
@@ -251,6 +536,7 @@ class SVHangmanAPI(remote.Service):
                       path='game/{urlsafe_key}/history',
                       name='get_game_history',
                       http_method='GET')
+    @instrument
     def get_game_history(self, request):
         """Returns History of moves made
         Args:
@@ -275,50 +561,115 @@ class SVHangmanAPI(remote.Service):
                       path='user/leader_board',
                       name='get_high_scores',
                       http_method='GET')
+    @instrument
     def get_high_scores(self, request):
         """Return a leader board of top scorers
         Args:
             The HIGH_SCORE_REQUEST objects with an optional number_of_results
-            parameter.
+            parameter and an optional period: all_time (default), daily or
+            weekly.
 
         Returns:
             ScoreForms: multiple ScoreForm protoRPC messages displaying a
-            leaderboard of games with most points.
+            leaderboard of games with most points. Daily and weekly boards
+            cover the current day or week and have at most 100 scores.
 
         Raises:
-            None
+            endpoints.BadRequestException: if the period is not valid.
         """
         result_count = 10
         if request.number_of_results is not None:
             result_count = request.number_of_results
-        return ScoreForms(items=[score.to_form() for score in Score.query().
-                                 order(-Score.points).fetch(result_count)])
-
-    @endpoints.method(request_message=message_types.VoidMessage,
+        period = request.period or 'all_time'
+        if period not in LEADERBOARD_PERIODS:
+            raise endpoints.BadRequestException(
+                'Period must be one of: %s' % ', '.join(LEADERBOARD_PERIODS))
+        if period != 'all_time':
+            board_id = period_board(date.today(), period)[0]
+            board = Leaderboard.get_board(board_id)
+            if not board:
+                return ScoreForms(items=[])
+            return board.to_forms(result_count)
+        if result_count <= LEADERBOARD_SIZE:
+            return Leaderboard.get_board().to_forms(result_count)
+        return Score.to_forms(Score.query().order(-Score.points).
+                              fetch(result_count))
+
+    @endpoints.method(request_message=RANKINGS_REQUEST,
                       response_message=RankForms,
                       path='user/rankings',
                       name='get_user_rankings',
                       http_method='GET')
+    @instrument
     def get_user_rankings(self, request):
-        """Return all user rankings
+        """Return a page of user rankings
         Args:
-             None
+             The RANKINGS_REQUEST objects with an optional page_size (default
+             50, at most 200) and the cursor returned with the previous page.
 
         Returns:
              RankForms: Multiple RankForm protoRPC messages displaying the
-             name, total_played, total_score and ordered by average_score
+             name, total_played, total_score and ordered by average_score,
+             with a next_cursor if there are more users.
+
+        Raises:
+             endpoints.BadRequestException: if the cursor is invalid.
+        """
+        page_size = min(request.page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        users, next_cursor, more = User.query().order(
+            -User.average_score).fetch_page(
+                page_size, start_cursor=get_cursor(request.cursor))
+        forms = RankForms(items=[user.to_rank_form() for user in users])
+        if more and next_cursor:
+            forms.next_cursor = next_cursor.urlsafe()
+        return forms
+
+    @endpoints.method(request_message=USER_REQUEST,
+                      response_message=RankForm,
+                      path='user/{user_name}/rank',
+                      name='get_user_rank',
+                      http_method='GET')
+    @instrument
+    def get_user_rank(self, request):
+        """Return the rank of a user by average_score
+        Args:
+             The USER_REQUEST objects, which include a user name from the
+             client.
+
+        Returns:
+             RankForm: the users name, total_played, total_score,
+             average_score and rank. Users with the same average share a rank.
 
         Raises:
-             None
+             endpoints.NotFoundException: if client supplied name is not
+             found.
         """
-        users = User.query().order(-User.average_score)
-        return RankForms(items=[user.to_rank_form() for user in users])
+        user = User.get_by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                'A user with that name does not exist!')
+        return user.to_rank_form(RankerShard.get_rank(user.average_score))
+
+    @endpoints.method(request_message=message_types.VoidMessage,
+                      response_message=GlobalStatsForm,
+                      path='stats',
+                      name='get_global_stats',
+                      http_method='GET')
+    @instrument
+    def get_global_stats(self, request):
+        """Return the site wide game totals
+        Returns:
+             GlobalStatsForm: The number of games started, finished and won
+             and the total points scored.
+        """
+        return GlobalStatsShard.to_form()
 
     @endpoints.method(request_message=WordForm,
                       response_message=StringMessage,
                       path='word',
                       name='add_word',
                       http_method='POST')
+    @instrument
     def add_word(self, request):
         """Add word to list of words
         Args:
@@ -332,20 +683,35 @@ class SVHangmanAPI(remote.Service):
             endpoints.BadRequestException: if the word is not a single word or
             contains special characters and numbers.
         """
-        if Word.query(Word.word == request.word).get():
+        if not Word.is_valid(request.word):
+            raise endpoints.BadRequestException('Please Enter One Word!')
+        if Word.exists(request.word):
             raise endpoints.ConflictException('That word is in the list!')
-        else:
-            word_list = []
-            temp = request.word.upper()
-            for i in temp:
-                if i == " " or i < 'A' or i > 'Z':
-                    raise endpoints.BadRequestException(
-                        'Please Enter One Word!')
-                else:
-                    word_list.append(i)
-            w = Word(word=request.word, word_list=word_list)
-            w.put()
+        Word.from_word(request.word).put()
+        add_to_word_pool([request.word])
         return StringMessage(message='Added %s to the list!' % request.word)
 
+    @endpoints.method(request_message=WordsForm,
+                      response_message=WordImportForm,
+                      path='words',
+                      name='add_words',
+                      http_method='POST')
+    @instrument
+    def add_words(self, request):
+        """Add many words to the list of words
+        Args:
+            The WordsForm objects which include a list of 'words'
+
+        Returns:
+            WordImportForm: the number of words inserted, the number already
+            in the list and the number rejected as invalid.
+
+        Raises:
+            None
+        """
+        inserted, duplicates, rejected = Word.add_words(request.words)
+        return WordImportForm(inserted=inserted, duplicates=duplicates,
+                              rejected=rejected)
+
 
 api = endpoints.api_server([SVHangmanAPI])
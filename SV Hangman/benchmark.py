@@ -0,0 +1,287 @@
+"""benchmark.py - Offline load test of SVHangmanAPI against the App Engine
+testbed. Simulates players doing create_user, new_game, make_move until the
+game ends, and leaderboard reads, with the players' steps interleaved. For
+each endpoint it reports latency percentiles, ops/sec and datastore and
+memcache RPCs per call.
+
+Usage:
+    python benchmark.py --sdk ~/google-cloud-sdk/platform/google_appengine
+        [--players 200] [--words 1000] [--seed 1]
+        [--output run.json] [--baseline previous.json]
+
+With --startup it instead reports the time to import the API and handler
+modules and the latency of the first new_game on a cold instance, with and
+without the warmup handler having run.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+from collections import defaultdict
+
+
+def setup_sdk(sdk_path):
+    """Puts the App Engine SDK and its bundled libraries on sys.path"""
+    sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class RpcCounter(object):
+    """Counts datastore and memcache RPCs made through the api proxy"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def record(self, service, call, request, response):
+        self.counts['%s.%s' % (service, call)] += 1
+
+    def snapshot(self):
+        return dict(self.counts)
+
+
+class EndpointStats(object):
+    """Latencies and RPC counts of the calls to one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.rpcs = defaultdict(int)
+
+    def add(self, seconds, before, after):
+        self.latencies.append(seconds)
+        for name, count in after.items():
+            self.rpcs[name] += count - before.get(name, 0)
+
+    def percentile(self, p):
+        ordered = sorted(self.latencies)
+        index = min(int(round(p / 100.0 * (len(ordered) - 1))),
+                    len(ordered) - 1)
+        return ordered[index]
+
+    def summary(self):
+        calls = len(self.latencies)
+        total = sum(self.latencies)
+        return {
+            'calls': calls,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'ops_per_sec': calls / total if total else 0.0,
+            'rpcs_per_call': dict((name, float(count) / calls)
+                                  for name, count in self.rpcs.items()),
+        }
+
+
+class Benchmark(object):
+    def __init__(self, players, words, seed):
+        self.players = players
+        self.words = words
+        self.random = random.Random(seed)
+        self.stats = defaultdict(EndpointStats)
+
+    def start(self):
+        from google.appengine.api import apiproxy_stub_map
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        # endpoints reads the app revision from the version id
+        self.testbed.setup_env(current_version_id='benchmark.1',
+                               overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        self.counter = RpcCounter()
+        for service in ('datastore_v3', 'memcache'):
+            # The hook must be a function or method, not a callable object
+            apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+                'benchmark_' + service, self.counter.record, service)
+
+        start = time.time()
+        import api
+        self.import_api_sec = time.time() - start
+        start = time.time()
+        import main
+        self.import_main_sec = time.time() - start
+        self.api_module = api
+        self.main_module = main
+        self.service = api.SVHangmanAPI()
+
+    def stop(self):
+        self.testbed.deactivate()
+
+    def call(self, name, container, **fields):
+        """Calls an endpoint method and records its latency and RPCs"""
+        from google.appengine.ext import ndb
+        request = container.combined_message_class(**fields)
+        before = self.counter.snapshot()
+        start = time.time()
+        response = getattr(self.service, name)(request)
+        self.stats[name].add(time.time() - start, before,
+                             self.counter.snapshot())
+        ndb.get_context().clear_cache()
+        return response
+
+    def seed_words(self):
+        from models import Word
+        words = set()
+        while len(words) < self.words:
+            words.add(''.join(self.random.choice(string.ascii_uppercase)
+                              for _ in range(self.random.randint(4, 10))))
+        Word.add_words(sorted(words))
+
+    def player(self, number):
+        """Generator of one player's steps, so players can be interleaved"""
+        api = self.api_module
+        name = 'player%d' % number
+        self.call('create_user', api.USER_REQUEST, user_name=name,
+                  email='%s@example.com' % name)
+        yield
+        game = self.call('new_game', api.NEW_GAME_REQUEST, user_name=name)
+        yield
+        letters = list(string.ascii_uppercase)
+        self.random.shuffle(letters)
+        for letter in letters:
+            game = self.call('make_move', api.MAKE_MOVE_REQUEST,
+                             urlsafe_key=game.urlsafe_key, guess=letter)
+            yield
+            if game.game_over:
+                break
+        self.call('get_high_scores', api.HIGH_SCORE_REQUEST,
+                  number_of_results=10)
+        yield
+        self.call('get_user_rankings', api.RANKINGS_REQUEST, page_size=50)
+        yield
+
+    def run(self):
+        self.seed_words()
+        active = [self.player(i) for i in range(self.players)]
+        start = time.time()
+        while active:
+            player = self.random.choice(active)
+            try:
+                next(player)
+            except StopIteration:
+                active.remove(player)
+        self.elapsed = time.time() - start
+
+    def cold_start(self):
+        """Drops the per-instance pools and memcache, as on a new instance"""
+        import models
+        from google.appengine.api import memcache
+        models._word_pool.update(version=None, words=[])
+        models._word_index.update(version=None, index=None)
+        models._difficulty_pool.update(expires=0, words={})
+        memcache.flush_all()
+
+    def first_game(self, name):
+        """Returns the seconds taken by a new_game right after a cold
+        start"""
+        api = self.api_module
+        self.call('create_user', api.USER_REQUEST, user_name=name,
+                  email='%s@example.com' % name)
+        self.cold_start()
+        start = time.time()
+        self.call('new_game', api.NEW_GAME_REQUEST, user_name=name)
+        return time.time() - start
+
+    def run_startup(self):
+        self.seed_words()
+        self.startup = {'import_api_sec': self.import_api_sec,
+                        'import_main_sec': self.import_main_sec,
+                        'cold_new_game_sec': self.first_game('cold')}
+        self.cold_start()
+        start = time.time()
+        self.main_module.warm_up()
+        self.startup['warm_up_sec'] = time.time() - start
+        api = self.api_module
+        self.call('create_user', api.USER_REQUEST, user_name='warm',
+                  email='warm@example.com')
+        start = time.time()
+        self.call('new_game', api.NEW_GAME_REQUEST, user_name='warm')
+        self.startup['warm_new_game_sec'] = time.time() - start
+
+    def report(self):
+        return {
+            'players': self.players,
+            'words': self.words,
+            'elapsed_sec': self.elapsed,
+            'endpoints': dict((name, stats.summary())
+                              for name, stats in self.stats.items()),
+        }
+
+
+def print_report(report, baseline=None):
+    print '%d players, %d words, %.2fs' % (
+        report['players'], report['words'], report['elapsed_sec'])
+    print '%-20s %7s %9s %9s %9s %9s %11s' % (
+        'endpoint', 'calls', 'p50 ms', 'p95 ms', 'p99 ms', 'ops/s',
+        'rpcs/call')
+    for name, summary in sorted(report['endpoints'].items()):
+        rpcs = sum(summary['rpcs_per_call'].values())
+        line = '%-20s %7d %9.2f %9.2f %9.2f %9.1f %11.2f' % (
+            name, summary['calls'], summary['p50_ms'], summary['p95_ms'],
+            summary['p99_ms'], summary['ops_per_sec'], rpcs)
+        old = baseline and baseline['endpoints'].get(name)
+        if old:
+            old_rpcs = sum(old['rpcs_per_call'].values())
+            line += '  (p95 %+.2f ms, rpcs %+.2f)' % (
+                summary['p95_ms'] - old['p95_ms'], rpcs - old_rpcs)
+        print line
+        for rpc, count in sorted(summary['rpcs_per_call'].items()):
+            print '    %-30s %.2f' % (rpc, count)
+
+
+def print_startup(startup):
+    for name in ('import_api_sec', 'import_main_sec', 'warm_up_sec',
+                 'cold_new_game_sec', 'warm_new_game_sec'):
+        print '%-20s %9.2f ms' % (name[:-4], startup[name] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sdk', required=True,
+                        help='path to the App Engine Python SDK')
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--words', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--baseline', help='JSON report to compare with')
+    parser.add_argument('--startup', action='store_true',
+                        help='measure instance startup instead')
+    args = parser.parse_args()
+
+    setup_sdk(args.sdk)
+    benchmark = Benchmark(args.players, args.words, args.seed)
+    benchmark.start()
+    try:
+        if args.startup:
+            benchmark.run_startup()
+        else:
+            benchmark.run()
+    finally:
+        benchmark.stop()
+    if args.startup:
+        print_startup(benchmark.startup)
+        return
+    report = benchmark.report()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
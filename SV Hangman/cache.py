@@ -0,0 +1,131 @@
+"""cache.py - Read-through/write-through cache of entities keyed by their
+urlsafe key. Entities are held in memcache and, for a short time, in a small
+per-instance LRU so hot games are served without datastore reads."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import ndb
+
+from stats import record_cache
+
+MEMCACHE_PREFIX = 'entity:'
+MEMCACHE_TTL = 3600
+LOCAL_CACHE_SIZE = 1000
+# Other instances may write the same entity, so local copies are only
+# trusted for reads and only for this many seconds
+LOCAL_CACHE_TTL = 1.0
+
+
+class LRUCache(object):
+    """Thread safe least recently used cache with a time to live"""
+
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None or item[0] < time.time():
+                return None
+            self._items[key] = item
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + self.ttl, value)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+_local = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+_adapter = ndb.ModelAdapter()
+
+
+def _encode(entity):
+    return _adapter.entity_to_pb(entity).Encode()
+
+
+def _decode(data):
+    return _adapter.pb_to_entity(entity_pb.EntityProto(data))
+
+
+def get_entity(key, for_update=False):
+    """Returns the entity for a key from the local cache, memcache or the
+    datastore, filling the caches on the way back.
+
+    Args:
+        key: The ndb.Key of the entity.
+        for_update: True if the caller will write the entity back with
+            cache_entity. Skips the local cache and remembers the memcache
+            compare-and-set id so the write cannot overwrite a newer one.
+
+    Returns:
+        The entity or None if it does not exist."""
+    urlsafe = key.urlsafe()
+    if not for_update:
+        data = _local.get(urlsafe)
+        if data is not None:
+            record_cache(True)
+            return _decode(data)
+    client = memcache.Client()
+    data = client.gets(MEMCACHE_PREFIX + urlsafe)
+    record_cache(data is not None)
+    if data is None:
+        entity = key.get(use_memcache=False)
+        if entity is None:
+            return None
+        data = _encode(entity)
+        client.add(MEMCACHE_PREFIX + urlsafe, data, time=MEMCACHE_TTL)
+        if for_update:
+            client.gets(MEMCACHE_PREFIX + urlsafe)
+    else:
+        entity = _decode(data)
+    _local.set(urlsafe, data)
+    entity._cas_client = client
+    return entity
+
+
+def cache_entity(entity):
+    """Writes an entity that has just been put through to the caches. If the
+    cached copy changed since get_entity read it, the copy is dropped
+    instead so the next read goes to the datastore."""
+    urlsafe = entity.key.urlsafe()
+    data = _encode(entity)
+    client = getattr(entity, '_cas_client', None)
+    if client is None:
+        stored = memcache.add(MEMCACHE_PREFIX + urlsafe, data,
+                              time=MEMCACHE_TTL)
+    else:
+        stored = client.cas(MEMCACHE_PREFIX + urlsafe, data,
+                            time=MEMCACHE_TTL)
+    if stored:
+        _local.set(urlsafe, data)
+    else:
+        uncache_entity(entity.key)
+
+
+def uncache_entity(key):
+    """Removes an entity from the caches"""
+    urlsafe = key.urlsafe()
+    _local.delete(urlsafe)
+    memcache.delete(MEMCACHE_PREFIX + urlsafe)
+
+
+def uncache_entities(keys):
+    """Removes a list of entities from the caches"""
+    urlsafes = [key.urlsafe() for key in keys]
+    for urlsafe in urlsafes:
+        _local.delete(urlsafe)
+    memcache.delete_multi(urlsafes, key_prefix=MEMCACHE_PREFIX)
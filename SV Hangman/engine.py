@@ -0,0 +1,88 @@
+"""engine.py - The rules of the game, free of the datastore so games can be
+played in memory. A GameState holds the target, the guessed letters as a 26
+bit mask, the order of guesses and the attempts remaining, the same state
+the Game model stores. Game and the endpoints play guesses through guess(),
+and simulate.py plays whole games with it offline."""
+
+MAX_ATTEMPTS = 7
+# Points for a win on top of the attempts remaining
+WIN_BONUS = 3
+ALREADY_GUESSED = 'You have already tried that!'
+
+
+def letter_bit(letter):
+    """Returns the bit for an uppercase letter in a guessed letters mask"""
+    return 1 << (ord(letter) - ord('A'))
+
+
+def word_mask(word):
+    """Returns the mask of the letters in an uppercase word"""
+    mask = 0
+    for letter in word:
+        mask |= letter_bit(letter)
+    return mask
+
+
+def is_valid_guess(guess):
+    """Returns True if a guess is a single uppercase letter"""
+    return len(guess) == 1 and 'A' <= guess <= 'Z'
+
+
+class GameState(object):
+    """The state of one game"""
+    __slots__ = ('target', 'target_mask', 'guessed', 'moves',
+                 'attempts_remaining')
+
+    def __init__(self, target, guessed=0, moves='',
+                 attempts_remaining=MAX_ATTEMPTS):
+        self.target = target
+        self.target_mask = word_mask(target)
+        self.guessed = guessed
+        self.moves = moves
+        self.attempts_remaining = attempts_remaining
+
+    def has_guessed(self, letter):
+        return bool(self.guessed & letter_bit(letter))
+
+    def is_solved(self):
+        """Returns True if every letter of the target has been guessed"""
+        return not self.target_mask & ~self.guessed
+
+    def pattern(self):
+        """Returns the target with the letters not guessed yet as '_'"""
+        guessed = self.guessed
+        return ''.join(letter if guessed & letter_bit(letter) else '_'
+                       for letter in self.target)
+
+
+def apply(state, letter):
+    """Applies a new, valid uppercase guess to a game.
+
+    Returns:
+        A message describing the outcome and True or False if the guess won
+        or lost the game, None if the game goes on."""
+    bit = letter_bit(letter)
+    state.guessed |= bit
+    state.moves += letter
+    if state.target_mask & bit:
+        if not state.target_mask & ~state.guessed:
+            return "You Won!!", True
+        return "You guessed correct!", None
+    state.attempts_remaining -= 1
+    if state.attempts_remaining <= 0:
+        state.attempts_remaining = 0
+        return "Game Over! The word was: %s" % state.target, False
+    return 'Uh-Oh. Try Again.', None
+
+
+def guess(state, letter):
+    """Plays a valid uppercase guess. A letter already guessed is not
+    applied and returns ALREADY_GUESSED; otherwise see apply()."""
+    if state.guessed & letter_bit(letter):
+        return ALREADY_GUESSED, None
+    return apply(state, letter)
+
+
+def score(won, attempts_remaining):
+    """Returns the points for a finished game"""
+    return attempts_remaining + WIN_BONUS if won else 0
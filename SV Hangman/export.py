@@ -0,0 +1,122 @@
+"""export.py - Admin only export of Score, Game and User entities as newline
+delimited JSON for the data warehouse. Rows are read EXPORT_PAGE_SIZE at a
+time with query cursors and written to the response as each page is read,
+so memory use does not grow with the table; the pages are also kept out of
+the ndb context cache. A response holds at most EXPORT_MAX_ROWS rows; if
+more remain the cursor to resume from is returned in the X-Next-Cursor
+header.
+
+    /admin/export/score?since=2016-01-31&cursor=...
+"""
+
+import json
+import webapp2
+from datetime import datetime
+from google.appengine.datastore.datastore_query import Cursor
+from models import User, Game, Score, get_user_names
+
+EXPORT_PAGE_SIZE = 500
+EXPORT_MAX_ROWS = 20000
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def _score_query(since):
+    if since is None:
+        return Score.query()
+    return Score.query(Score.date >= since).order(Score.date, Score.key)
+
+
+def _score_row(score, names):
+    return {'key': score.key.urlsafe(),
+            'user': score.user.urlsafe(),
+            'user_name': names[score.user],
+            'date': _date(score.date),
+            'won': score.won,
+            'guesses': score.guesses,
+            'points': score.points,
+            'word': score.word}
+
+
+def _game_query(since):
+    """Games that ended on or after since, or all games"""
+    if since is None:
+        return Game.query()
+    return Game.query(Game.ended >= datetime.combine(
+        since, datetime.min.time())).order(Game.ended, Game.key)
+
+
+def _game_row(game, names):
+    return {'key': game.key.urlsafe(),
+            'user': game.user.urlsafe(),
+            'user_name': names[game.user],
+            'target': game.target,
+            'moves': game.moves,
+            'attempts_remaining': game.attempts_remaining,
+            'game_over': game.game_over,
+            'ended': _date(game.ended)}
+
+
+def _user_query(since):
+    return User.query()
+
+
+def _user_row(user, names):
+    return {'key': user.key.urlsafe(),
+            'name': user.name,
+            'wins': user.wins,
+            'total_played': user.total_played,
+            'total_score': user.total_score,
+            'average_score': user.average_score}
+
+
+# Kind to its query, row builder and whether rows need their user's name.
+# Users have no date, so since is rejected for them.
+EXPORTS = {
+    'score': (_score_query, _score_row, True),
+    'game': (_game_query, _game_row, True),
+    'user': (_user_query, _user_row, False),
+}
+
+
+class Export(webapp2.RequestHandler):
+    def get(self, kind):
+        """Write up to EXPORT_MAX_ROWS rows of a kind as NDJSON, starting
+        from the 'cursor' parameter. The 'since' parameter, a YYYY-MM-DD
+        date, limits scores to that date and later and games to those that
+        ended on it or later."""
+        make_query, make_row, with_names = EXPORTS[kind]
+        since = self.request.get('since')
+        if since:
+            if kind == 'user':
+                self.abort(400, 'since is not supported for users')
+            try:
+                since = datetime.strptime(since, '%Y-%m-%d').date()
+            except ValueError:
+                self.abort(400, 'since must be YYYY-MM-DD')
+        try:
+            cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        except Exception:
+            self.abort(400, 'Invalid cursor')
+        query = make_query(since or None)
+        self.response.headers['Content-Type'] = 'application/x-ndjson'
+        rows = 0
+        more = True
+        while more and rows < EXPORT_MAX_ROWS:
+            entities, cursor, more = query.fetch_page(
+                min(EXPORT_PAGE_SIZE, EXPORT_MAX_ROWS - rows),
+                start_cursor=cursor, use_cache=False)
+            names = (get_user_names(e.user for e in entities)
+                     if with_names else None)
+            self.response.write(''.join(
+                json.dumps(make_row(e, names)) + '\n' for e in entities))
+            rows += len(entities)
+            more = more and cursor is not None
+        if more:
+            self.response.headers['X-Next-Cursor'] = cursor.urlsafe()
+
+
+app = webapp2.WSGIApplication(
+    [('/admin/export/(score|game|user)', Export)], debug=True)
@@ -1,25 +1,267 @@
-"""main.py - This file contains handlers that are called by cronjobs"""
+"""main.py - This file contains handlers that are called by cronjobs and
+task queues"""
 
+import json
 import webapp2
-from google.appengine.api import app_identity, mail
-from models import User, Game
+from datetime import date, datetime, timedelta
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+from models import (
+    User,
+    UserName,
+    Game,
+    ArchivedGame,
+    Word,
+    Leaderboard,
+    RankerShard,
+    GlobalStatsShard,
+    Migration,
+    USER_NAME_MIGRATION,
+    WORD_MIGRATION,
+    normalize_name,
+    get_word_pool,
+    get_difficulty_pool,
+    rebuild_word_pool,
+    rebuild_difficulty_pool
+)
+
+from cache import uncache_entities
+import stats
+
+MIGRATE_BATCH_SIZE = 200
+ARCHIVE_BATCH_SIZE = 200
+ARCHIVE_AFTER_DAYS = 30
+REMINDER_BATCH_SIZE = 100
+REMINDER_QUEUE = 'reminders'
 
 
 class SendReminderEmail(webapp2.RequestHandler):
     def get(self):
-        """Send Email reminder email to each user with an email
-        and unfinished games. Called every day using cron job"""
+        """Start sending reminder emails to each user with unfinished games.
+        Queues the first reminder batch, the batches then chain themselves.
+        Called every monday using cron job"""
+        run = date.today().strftime('%Y%m%d')
+        _add_task(REMINDER_QUEUE, url='/tasks/reminder_batch',
+                  name='reminder-batch-{}-0'.format(run),
+                  params={'run': run, 'batch': 0})
+
+
+class ReminderBatch(webapp2.RequestHandler):
+    def post(self):
+        """Queue a reminder mail for one page of users with unfinished games
+        and queue the next page. The page is read from a distinct projection
+        of Game.user so only users with real unfinished games are mailed.
+        Tasks are named by run, so a retried batch does not send twice."""
+        run = self.request.get('run')
+        batch = int(self.request.get('batch'))
+        cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        games, next_cursor, more = Game.query(
+            Game.game_over == False, projection=[Game.user],
+            distinct=True).fetch_page(REMINDER_BATCH_SIZE,
+                                      start_cursor=cursor)
+        users = ndb.get_multi([game.user for game in games])
+        tasks = [taskqueue.Task(
+            url='/tasks/send_reminder_mail',
+            name='reminder-{}-{}'.format(run, user.key.urlsafe()),
+            params={'user': user.key.urlsafe()})
+            for user in users if user and user.email]
+        if tasks:
+            _add_task(REMINDER_QUEUE, tasks)
+        if more and next_cursor:
+            _add_task(REMINDER_QUEUE, url='/tasks/reminder_batch',
+                      name='reminder-batch-{}-{}'.format(run, batch + 1),
+                      params={'run': run, 'batch': batch + 1,
+                              'cursor': next_cursor.urlsafe()})
+
+
+class SendReminderMail(webapp2.RequestHandler):
+    def post(self):
+        """Send the reminder email to a single user"""
+        # Only needed once a week, so not imported at instance startup
+        from google.appengine.api import app_identity, mail
+        user = ndb.Key(urlsafe=self.request.get('user')).get()
+        if not user or not user.email:
+            return
         app_id = app_identity.get_application_id()
-        users = User.query(User.email != None)
+        subject = "This is a reminder!"
+        body = "Hello {}, you have some unfinished games.".format(user.name)
+        mail.send_mail('noreply@{}.appspot.com'.format(app_id),
+                       user.email, subject, body)
+
+
+def _add_task(queue_name, task=None, **kwargs):
+    """Adds a task, or a list of tasks, to a queue, ignoring tasks that were
+    already added by an earlier attempt"""
+    try:
+        taskqueue.Queue(queue_name).add(task or taskqueue.Task(**kwargs))
+    except (taskqueue.TaskAlreadyExistsError,
+            taskqueue.TombstonedTaskError):
+        pass
+
+
+class MigrateGames(webapp2.RequestHandler):
+    def get(self):
+        """Convert games stored with pickled letter lists to the compact
+        state, one batch per request. With all=1 every game is put, which
+        also writes properties added since it was saved, such as
+        letters_revealed. Each batch queues the next one with its cursor so
+        an interrupted migration can be resumed."""
+        put_all = bool(self.request.get('all'))
+        cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        games, next_cursor, more = Game.query().fetch_page(
+            MIGRATE_BATCH_SIZE, start_cursor=cursor)
+        ndb.put_multi([game for game in games if put_all or game.migrated])
+        if more and next_cursor:
+            taskqueue.add(url='/crons/migrate_games', method='GET',
+                          params={'all': self.request.get('all'),
+                                  'cursor': next_cursor.urlsafe()})
+
+
+class MigrateWords(webapp2.RequestHandler):
+    def get(self):
+        """Re-key words stored with numeric ids by their uppercase word, one
+        batch per request, dropping duplicates. Each batch queues the next
+        one with its cursor and the last one rebuilds the word pool and marks
+        the migration done so add_word stops querying for old words."""
+        cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        words, next_cursor, more = Word.query().fetch_page(
+            MIGRATE_BATCH_SIZE, start_cursor=cursor)
+        old = [w for w in words if isinstance(w.key.id(), (int, long))]
+        if old:
+            ndb.put_multi([Word.from_word(w.word) for w in old])
+            ndb.delete_multi([w.key for w in old])
+        if more and next_cursor:
+            taskqueue.add(url='/crons/migrate_words', method='GET',
+                          params={'cursor': next_cursor.urlsafe()})
+        else:
+            rebuild_word_pool()
+            Migration.mark_done(WORD_MIGRATION)
+
+
+class MigrateUserNames(webapp2.RequestHandler):
+    def get(self):
+        """Add the UserName lookup for users created before it existed, one
+        batch per request. If two users share a normalized name the first
+        one keeps it. Each batch queues the next one with its cursor, and
+        the last one marks the migration done so user lookups stop falling
+        back to a query on the name."""
+        cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        users, next_cursor, more = User.query().fetch_page(
+            MIGRATE_BATCH_SIZE, start_cursor=cursor)
+        names = {}
         for user in users:
-            games = Game.query(Game.user == user.key, Game.game_over == False)
-            if games:
-                subject = "This is a reminder!"
-                body = "Hello {}, you have some unfinished games.".format(
-                    user.name)
+            names.setdefault(normalize_name(user.name), user.key)
+        keys = [ndb.Key(UserName, name) for name in names]
+        ndb.put_multi([UserName(key=key, user=names[key.id()])
+                       for key, user_name in zip(keys, ndb.get_multi(keys))
+                       if user_name is None])
+        if more and next_cursor:
+            taskqueue.add(url='/crons/migrate_user_names', method='GET',
+                          params={'cursor': next_cursor.urlsafe()})
+        else:
+            Migration.mark_done(USER_NAME_MIGRATION)
+
+
+class ArchiveGames(webapp2.RequestHandler):
+    def get(self):
+        """Replace games that ended more than ARCHIVE_AFTER_DAYS days ago, or
+        the number of days in the 'days' parameter, with ArchivedGame
+        records, one batch per request. Each batch queues the next one with
+        its cursor. Games that ended before Game.ended was recorded are not
+        archived. Called every day using cron job"""
+        days = int(self.request.get('days') or ARCHIVE_AFTER_DAYS)
+        cutoff = datetime.now() - timedelta(days=days)
+        cursor = Cursor(urlsafe=self.request.get('cursor') or None)
+        games, next_cursor, more = Game.query(
+            Game.game_over == True, Game.ended < cutoff).fetch_page(
+                ARCHIVE_BATCH_SIZE, start_cursor=cursor)
+        if games:
+            ndb.put_multi([ArchivedGame.from_game(game) for game in games])
+            keys = [game.key for game in games]
+            ndb.delete_multi(keys)
+            uncache_entities(keys)
+        if more and next_cursor:
+            taskqueue.add(url='/crons/archive_games', method='GET',
+                          params={'days': days,
+                                  'cursor': next_cursor.urlsafe()})
+
 
-                mail.send_mail('noreply@{}.appspot.com'.format(app_id),
-                               user.email, subject, body)
+class RebuildLeaderboard(webapp2.RequestHandler):
+    def get(self):
+        """Rebuild the all time leaderboard from the Score table, in case an
+        incremental update was lost. Called every day using cron job"""
+        Leaderboard.rebuild()
+
+
+class RebuildDifficultyPool(webapp2.RequestHandler):
+    def get(self):
+        """Regroup words by difficulty from their stats. Called every hour
+        using cron job"""
+        rebuild_difficulty_pool()
+
+
+class ExpireLeaderboards(webapp2.RequestHandler):
+    def get(self):
+        """Delete daily and weekly leaderboards past their retention. Called
+        every day using cron job"""
+        Leaderboard.delete_expired()
+
+
+class RebuildRanker(webapp2.RequestHandler):
+    def get(self):
+        """Rebuild the user rank counts from the User table, counting users
+        from before the ranker existed and fixing any drift. Called every
+        day using cron job"""
+        RankerShard.rebuild()
+
+
+class RebuildGlobalStats(webapp2.RequestHandler):
+    def get(self):
+        """Recount the site wide game totals from the Game and Score tables.
+        Run once to count existing games and again if the counts drift."""
+        GlobalStatsShard.rebuild()
+
+
+class Stats(webapp2.RequestHandler):
+    def get(self):
+        """Return the flushed per-endpoint stats as JSON. Stats are only
+        collected when HANGMAN_STATS is 1 in app.yaml."""
+        import api  # Registers the instrumented endpoint names
+        stats.flush()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'enabled': stats.ENABLED,
+                                        'fields': stats.fields(),
+                                        'stats': stats.read()}))
+
+
+def warm_up():
+    """Imports the API module and primes the word pools and the all time
+    leaderboard so the first requests on a new instance do not pay for
+    them"""
+    import api  # Builds the endpoints API
+    get_word_pool()
+    get_difficulty_pool()
+    Leaderboard.get_board()
+
+
+class Warmup(webapp2.RequestHandler):
+    def get(self):
+        """Called by App Engine before a new instance takes traffic"""
+        warm_up()
 
 app = webapp2.WSGIApplication(
-    [('/crons/send_reminder', SendReminderEmail)], debug=True)
+    [('/_ah/warmup', Warmup),
+     ('/crons/send_reminder', SendReminderEmail),
+     ('/tasks/reminder_batch', ReminderBatch),
+     ('/tasks/send_reminder_mail', SendReminderMail),
+     ('/crons/migrate_games', MigrateGames),
+     ('/crons/migrate_words', MigrateWords),
+     ('/crons/migrate_user_names', MigrateUserNames),
+     ('/crons/archive_games', ArchiveGames),
+     ('/crons/rebuild_leaderboard', RebuildLeaderboard),
+     ('/crons/expire_leaderboards', ExpireLeaderboards),
+     ('/crons/rebuild_ranker', RebuildRanker),
+     ('/crons/rebuild_global_stats', RebuildGlobalStats),
+     ('/crons/rebuild_difficulty_pool', RebuildDifficultyPool),
+     ('/admin/stats', Stats)], debug=True)
@@ -2,11 +2,63 @@
 entities used by the Game. Because these classes are also regular Python
 they can include other methods."""
 
+import logging
 import random
-from datetime import date
+import re
+import time
+import zlib
+from datetime import date, datetime, timedelta
 from protorpc import messages
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
+import engine
+from cache import cache_entity
+from engine import GameState, letter_bit
+
+# The pool is stored in chunks so no memcache value nears the 1MB limit. The
+# header holds the version, the generation naming the chunk keys and the
+# number of chunks.
+WORD_POOL_KEY = 'word_pool_header'
+WORD_POOL_VERSION_KEY = 'word_pool_version'
+WORD_POOL_CHUNK_SIZE = 10000
+DIFFICULTY_POOL_KEY = 'difficulty_pool'
+DIFFICULTY_POOL_TTL = 600
+DIFFICULTIES = ('easy', 'medium', 'hard')
+# Plays needed before a word is given a difficulty
+MIN_DIFFICULTY_PLAYS = 5
+
+LEADERBOARD_SIZE = 100
+# Average scores 0.00 - 10.00 in steps of 0.01
+RANK_BUCKETS = 1001
+RANKER_SHARDS = 20
+GLOBAL_STATS_SHARDS = 20
+GLOBAL_STATS_KEY = 'global_stats:'
+GLOBAL_STATS_TTL = 600
+GLOBAL_STATS_FIELDS = ('games_started', 'games_finished', 'games_won',
+                       'total_points')
+WORD_CHUNK_SIZE = 500
+GAME_CHUNK_SIZE = 500
+# \Z as $ would also match before a trailing newline
+VALID_WORD = re.compile(r'^[A-Z]+\Z')
+ALL_TIME_LEADERBOARD = 'all_time'
+LEADERBOARD_PERIODS = ('all_time', 'daily', 'weekly')
+# Days a daily or weekly board is kept after its period ends
+DAILY_LEADERBOARD_RETENTION = 7
+WEEKLY_LEADERBOARD_RETENTION = 28
+
+# Per-instance copy of the word pool, refreshed when the memcache version moves
+_word_pool = {'version': None, 'words': []}
+# Solver index of the word pool, rebuilt when the pool version moves
+_word_index = {'version': None, 'index': None}
+# Per-instance copy of the difficulty pool, refreshed when it expires
+_difficulty_pool = {'expires': 0, 'words': {}}
+# Names of the migrations this instance has seen completed
+_migrations_done = set()
+
+USER_NAME_MIGRATION = 'user_names'
+WORD_MIGRATION = 'words'
+
 
 class User(ndb.Model):
     """User Profile"""
@@ -17,23 +69,87 @@ class User(ndb.Model):
     total_score = ndb.IntegerProperty(default=0)
     average_score = ndb.FloatProperty(default=0.0)
 
+    @classmethod
+    @ndb.tasklet
+    def get_key_by_name_async(cls, name):
+        """Returns the key of the user with a name, looked up by key through
+        UserName. Until the UserName migration has completed, users created
+        before UserName existed are found by query and get their UserName
+        added. A missing or blank name has no user."""
+        if not name or not name.strip():
+            raise ndb.Return(None)
+        user_name = yield UserName.get_by_id_async(normalize_name(name))
+        if user_name:
+            raise ndb.Return(user_name.user)
+        migrated = yield Migration.is_done_async(USER_NAME_MIGRATION)
+        if migrated:
+            raise ndb.Return(None)
+        key = yield cls.query(cls.name == name).get_async(keys_only=True)
+        if key:
+            yield UserName.get_or_insert_async(normalize_name(name), user=key)
+        raise ndb.Return(key)
+
+    @classmethod
+    def get_key_by_name(cls, name):
+        return cls.get_key_by_name_async(name).get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def get_keys_by_names_async(cls, names):
+        """Returns a dict of name to user key, or None for names with no
+        user, fetching the UserNames of the distinct names with one batch
+        get. Names without a UserName fall back to get_key_by_name_async."""
+        names = list(set(names))
+        named = [name for name in names if name and name.strip()]
+        user_names = yield ndb.get_multi_async(
+            [ndb.Key(UserName, normalize_name(name)) for name in named])
+        keys = dict((name, user_name.user)
+                    for name, user_name in zip(named, user_names)
+                    if user_name)
+        missing = [name for name in names if name not in keys]
+        found = yield [cls.get_key_by_name_async(name) for name in missing]
+        keys.update(zip(missing, found))
+        raise ndb.Return(keys)
+
+    @classmethod
+    def get_keys_by_names(cls, names):
+        return cls.get_keys_by_names_async(names).get_result()
+
+    @classmethod
+    def get_by_name(cls, name):
+        """Returns the user with a name, see get_key_by_name_async"""
+        key = cls.get_key_by_name(name)
+        return key.get() if key else None
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def create(cls, name, email):
+        """Creates a user and claims their name in one transaction. Returns
+        None if the name is already taken."""
+        name_key = ndb.Key(UserName, normalize_name(name))
+        if name_key.get():
+            return None
+        user = cls(name=name, email=email)
+        user.put()
+        UserName(key=name_key, user=user.key).put()
+        return user
+
     def add_win(self):
-        """Adds a win to a user profile and update scores on profile"""
+        """Adds a win to a user profile and update scores on profile.
+        Does not put the entity."""
         self.wins += 1
         self.total_played += 1
         self.average_score = self.total_score / self.total_played
-        self.put()
 
     def add_loss(self):
-        """Add a loss to a user profile and update scores on profile"""
+        """Add a loss to a user profile and update scores on profile.
+        Does not put the entity."""
         self.total_played += 1
         self.average_score = self.total_score / self.total_played
-        self.put()
 
     def update_score(self, scr):
-        """Update a users total score"""
+        """Update a users total score. Does not put the entity."""
         self.total_score += scr
-        self.put()
 
     def to_form(self):
         """Returns user form representation of each user"""
@@ -46,16 +162,63 @@ class User(ndb.Model):
         form.total_score = self.total_score
         return form
 
-    def to_rank_form(self):
+    def to_rank_form(self, rank=None):
         """Returns rank form representation of user"""
         form = RankForm()
         form.name = self.name
         form.total_played = self.total_played
         form.total_score = self.total_score
         form.average_score = self.average_score
+        form.rank = rank
         return form
 
 
+def normalize_name(name):
+    """Returns the form of a user name that must be unique"""
+    return name.strip().lower()
+
+
+class UserName(ndb.Model):
+    """Maps a normalized user name, the key name, to the User"""
+    user = ndb.KeyProperty(required=True, kind=User, indexed=False)
+
+
+class Migration(ndb.Model):
+    """Marks a migration that has been run over every entity, keyed by the
+    migration's name"""
+    completed = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+    @classmethod
+    @ndb.tasklet
+    def is_done_async(cls, name):
+        """Returns True if the migration has completed. Once it has, the
+        answer is kept on the instance."""
+        if name in _migrations_done:
+            raise ndb.Return(True)
+        migration = yield cls.get_by_id_async(name)
+        if migration:
+            _migrations_done.add(name)
+        raise ndb.Return(migration is not None)
+
+    @classmethod
+    def mark_done(cls, name):
+        cls(id=name).put()
+
+
+@ndb.tasklet
+def get_user_names_async(keys):
+    """Returns a dict of user key to user name, fetching the distinct keys
+    with one batch get"""
+    keys = list(set(keys))
+    users = yield ndb.get_multi_async(keys)
+    raise ndb.Return(dict((key, user.name if user else None)
+                          for key, user in zip(keys, users)))
+
+
+def get_user_names(keys):
+    return get_user_names_async(keys).get_result()
+
+
 class UserForm(messages.Message):
     """User Form"""
     name = messages.StringField(1, required=True)
@@ -72,60 +235,243 @@ class UserForms(messages.Message):
 
 
 class Game(ndb.Model):
-    """Game Object"""
+    """Game Object. The target is stored as a string, the guessed letters as
+    a 26 bit mask and the order of guesses as a string. The answer, history
+    and failed tries are derived from those. Guesses are played by the
+    engine on a GameState of the game."""
     user = ndb.KeyProperty(required=True, kind=User)
     game_over = ndb.BooleanProperty(required=True, default=False)
-    attempts_remaining = ndb.IntegerProperty(required=True, default=7)
-    target = ndb.PickleProperty(required=True)
+    attempts_remaining = ndb.IntegerProperty(required=True,
+                                             default=engine.MAX_ATTEMPTS)
+    target = ndb.StringProperty('target_word', required=True, indexed=False)
     target_length = ndb.IntegerProperty(required=True)
-    history = ndb.PickleProperty(required=True, default=[])
-    answer = ndb.PickleProperty(required=True, default=[])
-    failed_tries = ndb.PickleProperty(required=True, default=[])
+    guessed = ndb.IntegerProperty(default=0, indexed=False)
+    moves = ndb.StringProperty(default='', indexed=False)
+    ended = ndb.DateTimeProperty()
+    # Stored so game summaries can be read with a projection query
+    letters_revealed = ndb.ComputedProperty(
+        lambda self: len(self.target) - self.answer.count('_'))
+    # Pickled letter lists written before the compact state, see migrate()
+    legacy_target = ndb.PickleProperty('target')
+    legacy_history = ndb.PickleProperty('history')
+    legacy_answer = ndb.PickleProperty('answer')
+    legacy_failed_tries = ndb.PickleProperty('failed_tries')
+    # Set on load when the old format was converted and still needs a put
+    migrated = False
+    # Games are cached by cache.py, so ndb's own memcache layer is skipped
+    _use_memcache = False
+    _use_entity_cache = True
 
     @classmethod
-    def new_game(cls, user):
-        """Creates and returns new games"""
-        items = Word.query().fetch()
-        word_target = random.choice(items)
+    def new_game(cls, user, difficulty=None):
+        """Creates and returns new games. If a difficulty is given the word
+        is picked from the words of that difficulty, or from all words if
+        none have it yet."""
+        word_target = random.choice(get_target_words(difficulty))
         game = Game(user=user,
-                    target=word_target.word_list,
-                    attempts_remaining=7,
+                    target=word_target,
+                    attempts_remaining=engine.MAX_ATTEMPTS,
                     game_over=False,
-                    target_length=len(word_target.word_list))
-        game.history = []
-        game.failed_tries = []
-        game.answer = ["_"] * len(word_target.word_list)
+                    target_length=len(word_target))
         game.put()
+        stats = GlobalStatsShard.increment_async(games_started=1)
+        cache_entity(game)
+        stats.get_result()
         return game
 
-    def to_form(self, message):
+    @classmethod
+    def new_games(cls, users, difficulty=None, same_word=False):
+        """Creates and returns a new game for each user key, with the words
+        drawn from one read of the pool and the games written with
+        put_multi, GAME_CHUNK_SIZE at a time. The games are not added to
+        the entity cache; their first read fills it."""
+        words = get_target_words(difficulty)
+        if same_word:
+            targets = [random.choice(words)] * len(users)
+        else:
+            targets = [random.choice(words) for _ in users]
+        games = [Game(user=user,
+                      target=target,
+                      attempts_remaining=engine.MAX_ATTEMPTS,
+                      game_over=False,
+                      target_length=len(target))
+                 for user, target in zip(users, targets)]
+        futures = []
+        for start in range(0, len(games), GAME_CHUNK_SIZE):
+            futures.extend(ndb.put_multi_async(
+                games[start:start + GAME_CHUNK_SIZE]))
+        ndb.Future.wait_all(futures)
+        for future in futures:
+            future.check_success()
+        GlobalStatsShard.increment_async(
+            games_started=len(games)).get_result()
+        return games
+
+    @classmethod
+    def _from_pb(cls, pb, set_key=True, ent=None, key=None):
+        """Migrates games stored in the old format as they are loaded.
+        Projection results lack the legacy properties and are left as
+        they are."""
+        ent = super(Game, cls)._from_pb(pb, set_key=set_key, ent=ent,
+                                        key=key)
+        if not ent._projection:
+            ent.migrated = ent.migrate()
+        return ent
+
+    def migrate(self):
+        """Converts the pickled letter lists of an old game to the compact
+        state. Returns True if the game needs to be put."""
+        if self.legacy_target is None:
+            return False
+        self.target = ''.join(self.legacy_target)
+        self.moves = ''.join(self.legacy_history or [])
+        self.guessed = 0
+        for letter in self.moves:
+            self.guessed |= letter_bit(letter)
+        self.legacy_target = None
+        self.legacy_history = None
+        self.legacy_answer = None
+        self.legacy_failed_tries = None
+        return True
+
+    def state(self):
+        """Returns the engine GameState of the game"""
+        return GameState(self.target, self.guessed, self.moves,
+                         self.attempts_remaining)
+
+    @property
+    def answer(self):
+        """List of the target letters guessed so far, '_' for the rest"""
+        return list(self.state().pattern())
+
+    @property
+    def history(self):
+        """List of all guesses in the order they were made"""
+        return list(self.moves)
+
+    @property
+    def failed_tries(self):
+        """List of the incorrect guesses in the order they were made"""
+        return [letter for letter in self.moves if letter not in self.target]
+
+    @property
+    def version(self):
+        """Move sequence number of the game, the number of moves made"""
+        return len(self.moves)
+
+    def is_solved(self):
+        """Returns True if every letter of the target has been guessed"""
+        return self.state().is_solved()
+
+    def play(self, guess):
+        """Plays a valid uppercase guess on the game in memory with
+        engine.guess. The caller ends the game or puts it.
+
+        Returns:
+            A message describing the outcome and True or False if the guess
+            won or lost the game, None if the game goes on."""
+        state = self.state()
+        message, won = engine.guess(state, guess)
+        self.guessed = state.guessed
+        self.moves = state.moves
+        self.attempts_remaining = state.attempts_remaining
+        return message, won
+
+    def to_form(self, message, user_name=None):
         """Returns the GameForm representation of the game"""
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
+        form.user_name = user_name or self.user.get().name
         form.attempts_remaining = self.attempts_remaining
         form.game_over = self.game_over
         form.history = str(self.history)
         form.answer = str(self.answer)
         form.failed_tries = str(self.failed_tries)
         form.message = message
+        form.version = self.version
         return form
 
+    @classmethod
+    def summaries(cls, user_key, game_over, page_size, cursor=None):
+        """Returns a page of GameSummaryForms of a users games that have or
+        have not ended, read with a projection query"""
+        games, next_cursor, more = cls.query(
+            cls.user == user_key, cls.game_over == game_over,
+            projection=[cls.attempts_remaining, cls.letters_revealed,
+                        cls.target_length]).fetch_page(
+                            page_size, start_cursor=cursor)
+        forms = GameSummaryForms(items=[GameSummaryForm(
+            urlsafe_key=game.key.urlsafe(),
+            attempts_remaining=game.attempts_remaining,
+            letters_revealed=game.letters_revealed,
+            target_length=game.target_length,
+            game_over=game_over) for game in games])
+        if more and next_cursor:
+            forms.next_cursor = next_cursor.urlsafe()
+        return forms
+
+    @classmethod
+    def to_forms(cls, games, message, names=None):
+        """Returns a GameForms of the games, looking up all of their users
+        with a single batch get unless a dict of user key to name is
+        given"""
+        games = list(games)
+        if names is None:
+            names = get_user_names(game.user for game in games)
+        return GameForms(items=[game.to_form(message, names[game.user])
+                                for game in games])
+
+    @ndb.transactional(xg=True)
     def end_game(self, won=False):
-        """End the current game and call relevant win/loss functions"""
-        self.game_over = True
-        self.put()
+        """End the current game and call relevant win/loss functions. The
+        Game, User and Score entities are written together in one
+        cross-group transaction.
 
+        Returns:
+            The Score, the User and the user's average score before the
+            game, to pass to record_end once the transaction has
+            committed."""
+        self.game_over = True
+        self.ended = datetime.now()
+        user_future = self.user.get_async()
         score = Score(user=self.user, date=date.today(), won=won,
-                      guesses=self.attempts_remaining)
+                      guesses=self.attempts_remaining, word=self.target)
+        user = user_future.get_result()
+        old_average = user.average_score
+        score.points = engine.score(won, score.guesses)
         if won:
-            self.user.get().update_score(score.guesses + 3)
-            self.user.get().add_win()
-            score.points = score.guesses + 3
-            score.put()
+            user.update_score(score.points)
+            user.add_win()
         else:
-            self.user.get().add_loss()
-            score.put()
+            user.add_loss()
+        ndb.put_multi([self, user, score])
+        return score, user, old_average
+
+    def record_end(self, score, user, old_average):
+        """Adds a game that end_game has ended to the leaderboards, user
+        ranks, word stats and global counters, and caches the game. Must be
+        called after end_game's transaction has committed and outside of
+        it. The game has already ended, so failures are logged rather than
+        raised; the leaderboard and ranker are rebuilt daily by cron."""
+        futures = [
+            Leaderboard.add_score_async(score, user.name),
+            Leaderboard.add_score_async(score, user.name,
+                                        *period_board(score.date, 'daily')),
+            Leaderboard.add_score_async(score, user.name,
+                                        *period_board(score.date, 'weekly')),
+            RankerShard.move_user_async(user.key, old_average,
+                                        user.average_score),
+            WordStats.record_async(self.target, score.won,
+                                   self.attempts_remaining),
+            GlobalStatsShard.increment_async(games_finished=1,
+                                             games_won=int(score.won),
+                                             total_points=score.points)]
+        cache_entity(self)
+        ndb.Future.wait_all(futures)
+        for future in futures:
+            if future.get_exception():
+                logging.error('Recording the end of game %s failed: %r',
+                              self.key.urlsafe(), future.get_exception())
 
 
 class Score (ndb.Model):
@@ -135,16 +481,325 @@ class Score (ndb.Model):
     won = ndb.BooleanProperty(required=True)
     guesses = ndb.IntegerProperty(required=True)
     points = ndb.IntegerProperty(required=True, default=0)
+    word = ndb.StringProperty()
 
-    def to_form(self):
+    def to_form(self, user_name=None):
         form = ScoreForm()
-        form.user_name = self.user.get().name
+        form.user_name = user_name or self.user.get().name
         form.date = str(self.date)
         form.won = self.won
         form.guesses = self.guesses
         form.points = self.points
+        form.word = self.word
         return form
 
+    @classmethod
+    def to_forms(cls, scores):
+        """Returns a ScoreForms of the scores, looking up all of their users
+        with a single batch get"""
+        scores = list(scores)
+        names = get_user_names(score.user for score in scores)
+        return ScoreForms(items=[score.to_form(names[score.user])
+                                 for score in scores])
+
+
+class ArchivedGame(ndb.Model):
+    """Compact record of a completed game whose Game entity was deleted by
+    the archive job. Shares the id of the game it replaced."""
+    user = ndb.KeyProperty(required=True, kind=User)
+    ended = ndb.DateTimeProperty(required=True)
+    target = ndb.StringProperty(required=True, indexed=False)
+    moves = ndb.StringProperty(default='', indexed=False)
+    attempts_remaining = ndb.IntegerProperty(required=True, indexed=False)
+    won = ndb.BooleanProperty(required=True, indexed=False)
+
+    @classmethod
+    def from_game(cls, game):
+        return cls(id=game.key.id(), user=game.user, ended=game.ended,
+                   target=game.target, moves=game.moves,
+                   attempts_remaining=game.attempts_remaining,
+                   won=game.is_solved())
+
+    def to_form(self, user_name):
+        return ArchivedGameForm(user_name=user_name, ended=str(self.ended),
+                                target=self.target,
+                                history=str(list(self.moves)),
+                                attempts_remaining=self.attempts_remaining,
+                                won=self.won)
+
+
+class LeaderboardEntry(ndb.Model):
+    """A copy of a Score kept on a Leaderboard, with the user name stored so
+    the board renders without user lookups"""
+    user = ndb.KeyProperty(kind='User')
+    user_name = ndb.StringProperty()
+    date = ndb.DateProperty()
+    won = ndb.BooleanProperty()
+    guesses = ndb.IntegerProperty()
+    points = ndb.IntegerProperty()
+    word = ndb.StringProperty()
+
+    @classmethod
+    def from_score(cls, score, user_name):
+        return cls(user=score.user, user_name=user_name, date=score.date,
+                   won=score.won, guesses=score.guesses, points=score.points,
+                   word=score.word)
+
+    def to_form(self):
+        return ScoreForm(user_name=self.user_name, date=str(self.date),
+                         won=self.won, guesses=self.guesses,
+                         points=self.points, word=self.word)
+
+
+def period_board(day, period):
+    """Returns the id of the daily or weekly leaderboard a day falls in and
+    the date after which the board can be deleted"""
+    if period == 'daily':
+        return ('daily-%s' % day.isoformat(),
+                day + timedelta(days=DAILY_LEADERBOARD_RETENTION))
+    year, week, weekday = day.isocalendar()
+    week_end = day + timedelta(days=7 - weekday)
+    return ('weekly-%d-W%02d' % (year, week),
+            week_end + timedelta(days=WEEKLY_LEADERBOARD_RETENTION))
+
+
+class Leaderboard(ndb.Model):
+    """Top LEADERBOARD_SIZE scores ordered by points, kept in one entity.
+    It is updated as games end and read with a key get, which ndb serves
+    from memcache. Besides the all time board there is one board per day and
+    per week, see period_board, which are deleted by cron once expired."""
+    entries = ndb.LocalStructuredProperty(LeaderboardEntry, repeated=True)
+    expires = ndb.DateProperty()
+
+    @classmethod
+    def get_board(cls, board_id=ALL_TIME_LEADERBOARD):
+        """Returns the leaderboard, rebuilding it if it does not exist"""
+        board = cls.get_by_id(board_id)
+        if board is None and board_id == ALL_TIME_LEADERBOARD:
+            board = cls.rebuild()
+        return board
+
+    def qualifies(self, points):
+        """Returns True if a score with these points belongs on the board"""
+        return (len(self.entries) < LEADERBOARD_SIZE or
+                points > self.entries[-1].points)
+
+    @classmethod
+    @ndb.tasklet
+    def add_score_async(cls, score, user_name,
+                        board_id=ALL_TIME_LEADERBOARD, expires=None):
+        """Inserts a score into the board if it ranks in the top scores. A
+        missing all time board is first rebuilt from the Score table, so
+        the scores before it are not left out."""
+        board = yield cls.get_by_id_async(board_id)
+        rebuilt = board is None and board_id == ALL_TIME_LEADERBOARD
+        if rebuilt:
+            board = cls.rebuild()
+        if board is not None and not board.qualifies(score.points):
+            return
+        entry = LeaderboardEntry.from_score(score, user_name)
+
+        @ndb.tasklet
+        def insert():
+            board = yield cls.get_or_insert_async(board_id, expires=expires)
+            # The rebuild may already have read the score
+            if (not board.qualifies(entry.points) or
+                    rebuilt and entry in board.entries):
+                return
+            board.entries.append(entry)
+            # Stable sort keeps earlier scores ahead of later ones on ties
+            board.entries.sort(key=lambda e: -e.points)
+            del board.entries[LEADERBOARD_SIZE:]
+            yield board.put_async()
+        yield ndb.transaction_async(insert)
+
+    @classmethod
+    def rebuild(cls):
+        """Rebuilds the all time board from the Score table"""
+        scores = Score.query().order(-Score.points).fetch(LEADERBOARD_SIZE)
+        names = get_user_names(score.user for score in scores)
+        board = cls(id=ALL_TIME_LEADERBOARD,
+                    entries=[LeaderboardEntry.from_score(s, names[s.user])
+                             for s in scores])
+        board.put()
+        return board
+
+    @classmethod
+    def delete_expired(cls):
+        """Deletes the daily and weekly boards that have expired. The all
+        time board has no expiry, which sorts before every date, so it is
+        left out explicitly."""
+        keys = cls.query(cls.expires < date.today()).fetch(keys_only=True)
+        ndb.delete_multi([key for key in keys
+                          if key.id() != ALL_TIME_LEADERBOARD])
+
+    def to_forms(self, count):
+        """Returns a ScoreForms of the top count entries"""
+        return ScoreForms(items=[entry.to_form()
+                                 for entry in self.entries[:count]])
+
+
+def rank_bucket(average_score):
+    """Returns the ranker bucket of an average score"""
+    return max(0, min(int(round(average_score * 100)), RANK_BUCKETS - 1))
+
+
+class RankerShard(ndb.Model):
+    """One shard of a Fenwick tree counting users per average_score bucket.
+    A user is always counted in the same shard, picked from their key, so
+    game results spread their writes over RANKER_SHARDS entities. Bucket 0
+    is never counted since nobody ranks below it."""
+    tree = ndb.IntegerProperty(repeated=True, indexed=False)
+
+    @classmethod
+    def shard_id(cls, user_key):
+        return zlib.crc32(user_key.urlsafe()) % RANKER_SHARDS + 1
+
+    def add(self, bucket, delta):
+        """Adds delta to the count of a bucket"""
+        if not self.tree:
+            self.tree = [0] * RANK_BUCKETS
+        i = bucket + 1
+        while i <= RANK_BUCKETS:
+            self.tree[i - 1] += delta
+            i += i & -i
+
+    def count_to(self, bucket):
+        """Returns the number of users in buckets 0 up to bucket"""
+        total = 0
+        i = min(bucket + 1, len(self.tree))
+        while i > 0:
+            total += self.tree[i - 1]
+            i -= i & -i
+        return total
+
+    def count_above(self, bucket):
+        """Returns the number of users in buckets above bucket"""
+        return self.count_to(RANK_BUCKETS - 1) - self.count_to(bucket)
+
+    @classmethod
+    @ndb.tasklet
+    def move_user_async(cls, user_key, old_average, new_average):
+        """Moves a user from the bucket of their old average to the bucket
+        of their new one"""
+        old_bucket = rank_bucket(old_average)
+        new_bucket = rank_bucket(new_average)
+        if old_bucket == new_bucket:
+            return
+
+        @ndb.tasklet
+        def move():
+            shard = yield cls.get_or_insert_async(str(cls.shard_id(user_key)))
+            if old_bucket:
+                shard.add(old_bucket, -1)
+            if new_bucket:
+                shard.add(new_bucket, 1)
+            yield shard.put_async()
+        yield ndb.transaction_async(move)
+
+    @classmethod
+    def get_rank(cls, average_score):
+        """Returns the rank of an average score, 1 plus the number of users
+        with a higher average. Users in the same bucket share a rank."""
+        bucket = rank_bucket(average_score)
+        keys = [ndb.Key(cls, str(i)) for i in range(1, RANKER_SHARDS + 1)]
+        return 1 + sum(shard.count_above(bucket)
+                       for shard in ndb.get_multi(keys) if shard)
+
+    @classmethod
+    def rebuild(cls):
+        """Rebuilds every shard from the User table"""
+        shards = [cls(id=str(i)) for i in range(1, RANKER_SHARDS + 1)]
+        for user in User.query(projection=[User.average_score]):
+            bucket = rank_bucket(user.average_score)
+            if bucket:
+                shards[cls.shard_id(user.key) - 1].add(bucket, 1)
+        ndb.put_multi(shards)
+
+
+class GlobalStatsShard(ndb.Model):
+    """One shard of the site wide game counters. Each increment goes to a
+    random one of GLOBAL_STATS_SHARDS shards so busy periods do not queue
+    on a single entity group. The totals are also kept as memcache
+    counters, which increments update in place."""
+    games_started = ndb.IntegerProperty(default=0, indexed=False)
+    games_finished = ndb.IntegerProperty(default=0, indexed=False)
+    games_won = ndb.IntegerProperty(default=0, indexed=False)
+    total_points = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def shard_keys(cls):
+        return [ndb.Key(cls, str(i))
+                for i in range(1, GLOBAL_STATS_SHARDS + 1)]
+
+    @classmethod
+    @ndb.tasklet
+    def increment_async(cls, **deltas):
+        """Adds to the named counters in a random shard and, if the totals
+        are cached, to the cached totals"""
+        deltas = dict((field, delta) for field, delta in deltas.items()
+                      if delta)
+        if not deltas:
+            return
+
+        @ndb.tasklet
+        def increment():
+            shard = yield cls.get_or_insert_async(
+                str(random.randint(1, GLOBAL_STATS_SHARDS)))
+            for field, delta in deltas.items():
+                setattr(shard, field, getattr(shard, field) + delta)
+            yield shard.put_async()
+        yield ndb.transaction_async(increment)
+        context = ndb.get_context()
+        yield [context.memcache_incr(GLOBAL_STATS_KEY + field, delta)
+               for field, delta in deltas.items()]
+
+    @classmethod
+    def get_totals(cls):
+        """Returns a dict of each counter to its total, read from memcache
+        or, if any is missing, summed from one batch get of the shards"""
+        cached = memcache.get_multi(GLOBAL_STATS_FIELDS,
+                                    key_prefix=GLOBAL_STATS_KEY)
+        if len(cached) == len(GLOBAL_STATS_FIELDS):
+            return cached
+        shards = [s for s in ndb.get_multi(cls.shard_keys()) if s]
+        totals = dict((field, sum(getattr(s, field) for s in shards))
+                      for field in GLOBAL_STATS_FIELDS)
+        # add, so a total cached since the read is not overwritten
+        memcache.add_multi(totals, key_prefix=GLOBAL_STATS_KEY,
+                           time=GLOBAL_STATS_TTL)
+        return totals
+
+    @classmethod
+    def rebuild(cls):
+        """Recounts the totals from the Game and Score tables into the first
+        shard and clears the others. Games cancelled before the counters
+        existed are not counted."""
+        finished = Score.query().count()
+        won = Score.query(Score.won == True).count()
+        points = sum(score.points
+                     for score in Score.query(projection=[Score.points]))
+        started = finished + Game.query(Game.game_over == False).count()
+        shards = [cls(key=key) for key in cls.shard_keys()]
+        shards[0].populate(games_started=started, games_finished=finished,
+                           games_won=won, total_points=points)
+        ndb.put_multi(shards)
+        memcache.delete_multi(GLOBAL_STATS_FIELDS,
+                              key_prefix=GLOBAL_STATS_KEY)
+
+    @classmethod
+    def to_form(cls):
+        return GlobalStatsForm(**cls.get_totals())
+
+
+class GlobalStatsForm(messages.Message):
+    """Site wide totals of games started, finished and won and points
+    scored"""
+    games_started = messages.IntegerField(1, required=True)
+    games_finished = messages.IntegerField(2, required=True)
+    games_won = messages.IntegerField(3, required=True)
+    total_points = messages.IntegerField(4, required=True)
+
 
 class GameForm(messages.Message):
     """GameForm - Form Representation of GameState"""
@@ -156,6 +811,7 @@ class GameForm(messages.Message):
     history = messages.StringField(6, required=True)
     answer = messages.StringField(7, required=True)
     failed_tries = messages.StringField(8, required=True)
+    version = messages.IntegerField(9)
 
 
 class GameForms(messages.Message):
@@ -163,25 +819,344 @@ class GameForms(messages.Message):
     items = messages.MessageField(GameForm, 1, repeated=True)
 
 
+class GameSummaryForm(messages.Message):
+    """GameSummaryForm - Short form of a game state"""
+    urlsafe_key = messages.StringField(1, required=True)
+    attempts_remaining = messages.IntegerField(2, required=True)
+    letters_revealed = messages.IntegerField(3, required=True)
+    target_length = messages.IntegerField(4, required=True)
+    game_over = messages.BooleanField(5, required=True)
+
+
+class GameSummaryForms(messages.Message):
+    """Return multiple GameSummaryForms"""
+    items = messages.MessageField(GameSummaryForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+
+
+class ArchivedGameForm(messages.Message):
+    """ArchivedGameForm - Form Representation of an archived game"""
+    user_name = messages.StringField(1, required=True)
+    ended = messages.StringField(2, required=True)
+    target = messages.StringField(3, required=True)
+    history = messages.StringField(4, required=True)
+    attempts_remaining = messages.IntegerField(5, required=True)
+    won = messages.BooleanField(6, required=True)
+
+
+class ArchivedGameForms(messages.Message):
+    """Return multiple ArchivedGameForms"""
+    items = messages.MessageField(ArchivedGameForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+
+
 class StringMessage(messages.Message):
     """Outbound Message String"""
     message = messages.StringField(1, required=True)
 
 
 class Word(ndb.Model):
-    """Table of words"""
+    """Table of words, keyed by the uppercase word"""
     word = ndb.StringProperty(required=True)
     word_list = ndb.PickleProperty(repeated=True)
 
+    @classmethod
+    def is_valid(cls, word):
+        """Returns True if the word is a single word of letters only"""
+        return bool(VALID_WORD.match(word.upper()))
+
+    @classmethod
+    def from_word(cls, word):
+        """Returns a new Word entity for a valid word"""
+        upper = word.upper()
+        return cls(id=upper, word=word, word_list=list(upper))
+
+    @classmethod
+    def exists(cls, word):
+        """Returns True if a word is in the table. Until the word migration
+        has completed, words still stored with numeric ids are found by a
+        query on the word as given, uppercase, lowercase or capitalized."""
+        if cls.from_word(word).key.get():
+            return True
+        if Migration.is_done_async(WORD_MIGRATION).get_result():
+            return False
+        variants = list(set([word, word.upper(), word.lower(),
+                             word.capitalize()]))
+        return cls.query(cls.word.IN(variants)).get(keys_only=True) is not None
+
+    @classmethod
+    def add_words(cls, words):
+        """Adds the valid words that are not already in the table. Duplicates
+        are found with batch key gets and new words are written with
+        put_multi, WORD_CHUNK_SIZE at a time.
+
+        Returns:
+            The counts of inserted, duplicate and rejected words."""
+        inserted = duplicates = rejected = 0
+        seen = set()
+        added = []
+        for start in range(0, len(words), WORD_CHUNK_SIZE):
+            candidates = []
+            for word in words[start:start + WORD_CHUNK_SIZE]:
+                word = word.strip()
+                if not cls.is_valid(word):
+                    rejected += 1
+                elif word.upper() in seen:
+                    duplicates += 1
+                else:
+                    seen.add(word.upper())
+                    candidates.append(cls.from_word(word))
+            existing = ndb.get_multi([w.key for w in candidates])
+            new = [w for w, e in zip(candidates, existing) if e is None]
+            duplicates += len(candidates) - len(new)
+            ndb.put_multi(new)
+            added.extend(w.word for w in new)
+            inserted += len(new)
+        add_to_word_pool(added)
+        return inserted, duplicates, rejected
+
+
+class WordStats(ndb.Model):
+    """Results of the games played with a word, keyed by the uppercase
+    word"""
+    plays = ndb.IntegerProperty(default=0, indexed=False)
+    wins = ndb.IntegerProperty(default=0, indexed=False)
+    total_attempts_remaining = ndb.IntegerProperty(default=0, indexed=False)
+    difficulty = ndb.StringProperty(choices=DIFFICULTIES)
+
+    @property
+    def win_rate(self):
+        return float(self.wins) / self.plays if self.plays else 0.0
+
+    @property
+    def mean_attempts_remaining(self):
+        return (float(self.total_attempts_remaining) / self.plays
+                if self.plays else 0.0)
+
+    @classmethod
+    def record_async(cls, word, won, attempts_remaining):
+        """Adds the result of a game to the stats of its word"""
+        @ndb.tasklet
+        def record():
+            stats = yield cls.get_or_insert_async(word)
+            stats.plays += 1
+            stats.wins += int(won)
+            stats.total_attempts_remaining += attempts_remaining
+            stats.difficulty = stats.rate()
+            yield stats.put_async()
+        return ndb.transaction_async(record)
+
+    def rate(self):
+        """Returns the difficulty of the word by its win rate, or None if it
+        has not been played enough"""
+        if self.plays < MIN_DIFFICULTY_PLAYS:
+            return None
+        if self.win_rate >= 0.7:
+            return 'easy'
+        if self.win_rate >= 0.4:
+            return 'medium'
+        return 'hard'
+
+
+def get_word_pool():
+    """Returns the list of uppercase target words. The list is held in
+    instance memory and memcache under a version number, so picking a word
+    does not read the Word table. Rebuilds the pool if it is missing or
+    stale."""
+    version = memcache.get(WORD_POOL_VERSION_KEY)
+    if version is not None and _word_pool['version'] == version:
+        return _word_pool['words']
+    cached = _read_word_pool()
+    if cached is None or version is None or cached[0] != version:
+        version, words = rebuild_word_pool()
+    else:
+        words = [word for chunk in cached[2] for word in chunk]
+    _word_pool['version'], _word_pool['words'] = version, words
+    return words
+
+
+def rebuild_word_pool():
+    """Reads every Word and stores the pool in memcache under a new version,
+    which also names its chunks. The query is eventually consistent and can
+    miss a word added just before it, so the words of the pool it replaces
+    are kept too; words are never removed from the table."""
+    words = [w.word.upper() for w in Word.query(projection=[Word.word])]
+    previous = _read_word_pool()
+    if previous is not None:
+        known = set(words)
+        words.extend(word for chunk in previous[2] for word in chunk
+                     if word not in known)
+    version = _next_word_pool_version()
+    _write_word_pool(version, version, _chunk_words(words))
+    return version, words
+
+
+def _chunk_words(words):
+    return [words[i:i + WORD_POOL_CHUNK_SIZE]
+            for i in range(0, len(words), WORD_POOL_CHUNK_SIZE)]
+
+
+def _word_pool_chunk_keys(generation, count):
+    return ['%s:%d:%d' % (WORD_POOL_KEY, generation, i)
+            for i in range(count)]
+
+
+def _read_word_pool():
+    """Returns the version, generation and chunks of the pool in memcache,
+    or None if the header or any chunk is missing"""
+    header = memcache.get(WORD_POOL_KEY)
+    if header is None:
+        return None
+    version, generation, count = header
+    keys = _word_pool_chunk_keys(generation, count)
+    chunks = memcache.get_multi(keys)
+    if len(chunks) != count:
+        return None
+    return version, generation, [chunks[key] for key in keys]
+
+
+def _write_word_pool(version, generation, chunks, start=0):
+    """Stores the chunks from index start, then the header pointing at all
+    of them. If a chunk cannot be stored the header is not written, so the
+    pool is rebuilt on the next read."""
+    keys = _word_pool_chunk_keys(generation, len(chunks))
+    try:
+        if memcache.set_multi(dict(zip(keys[start:], chunks[start:]))):
+            return
+    except ValueError, e:
+        logging.error('Word pool chunk too large for memcache: %s', e)
+        return
+    memcache.set(WORD_POOL_KEY, (version, generation, len(chunks)))
+
+
+def _next_word_pool_version():
+    """Bumps the pool version. The counter is seeded from the clock so an
+    evicted version key never repeats a number an instance already holds."""
+    return memcache.incr(WORD_POOL_VERSION_KEY,
+                         initial_value=int(time.time() * 1000))
+
+
+def get_word_index():
+    """Returns a solver WordIndex of the word pool, built on first use and
+    rebuilt after the pool changes"""
+    # Only get_hint needs the solver, so it is not imported at startup
+    from solver import WordIndex
+    words = get_word_pool()
+    version = _word_pool['version']
+    if _word_index['index'] is None or _word_index['version'] != version:
+        _word_index['index'] = WordIndex(words)
+        _word_index['version'] = version
+    return _word_index['index']
+
+
+def get_target_words(difficulty=None):
+    """Returns the words of a difficulty, or the whole word pool if no
+    difficulty is given or no word has it yet"""
+    words = get_difficulty_pool().get(difficulty) if difficulty else None
+    return words or get_word_pool()
+
+
+def get_difficulty_pool():
+    """Returns a dict of difficulty to the list of words with it. The dict
+    is held in instance memory and memcache for DIFFICULTY_POOL_TTL seconds
+    and rebuilt from WordStats when it expires."""
+    if _difficulty_pool['expires'] > time.time():
+        return _difficulty_pool['words']
+    words = memcache.get(DIFFICULTY_POOL_KEY)
+    if words is None:
+        words = rebuild_difficulty_pool()
+    _difficulty_pool['expires'] = time.time() + DIFFICULTY_POOL_TTL
+    _difficulty_pool['words'] = words
+    return words
+
+
+def rebuild_difficulty_pool():
+    """Groups rated words by difficulty and stores them in memcache"""
+    words = {}
+    for difficulty in DIFFICULTIES:
+        words[difficulty] = [key.id() for key in WordStats.query(
+            WordStats.difficulty == difficulty).iter(keys_only=True)]
+    try:
+        memcache.set(DIFFICULTY_POOL_KEY, words, time=DIFFICULTY_POOL_TTL)
+    except ValueError, e:
+        # Too large for one value; each instance keeps its own copy
+        logging.error('Difficulty pool too large for memcache: %s', e)
+    return words
+
+
+def add_to_word_pool(words):
+    """Appends a list of newly added words to the cached pool, rewriting
+    only its last chunk and the chunks after it. If the cached pool is not
+    the one directly before the new version it is left alone and will be
+    rebuilt on the next read."""
+    if not words:
+        return
+    cached = _read_word_pool()
+    version = _next_word_pool_version()
+    if cached is not None and cached[0] == version - 1:
+        _, generation, chunks = cached
+        last = chunks.pop() if chunks else []
+        start = len(chunks)
+        chunks.extend(_chunk_words(last + [word.upper() for word in words]))
+        _write_word_pool(version, generation, chunks, start)
+
 
 class WordForm(messages.Message):
     """In-Bound Word"""
     word = messages.StringField(1, required=True)
 
 
+class WordsForm(messages.Message):
+    """In-Bound list of words for bulk import"""
+    words = messages.StringField(1, repeated=True)
+
+
+class WordImportForm(messages.Message):
+    """Counts of the words inserted, already present and rejected by a bulk
+    import"""
+    inserted = messages.IntegerField(1, required=True)
+    duplicates = messages.IntegerField(2, required=True)
+    rejected = messages.IntegerField(3, required=True)
+
+
+class HintForm(messages.Message):
+    """Suggested next guess for a game and the number of words that still
+    fit it"""
+    letter = messages.StringField(1)
+    candidates = messages.IntegerField(2, required=True)
+
+
 class MakeMoveForm(messages.Message):
-    """Used to make a move in an existing game."""
+    """Used to make a move in an existing game. expected_version is the
+    version of the game the move was made from, see make_move."""
     guess = messages.StringField(1, required=True)
+    expected_version = messages.IntegerField(2)
+
+
+class NewGamesForm(messages.Message):
+    """Used to create a game for each of a list of users at once"""
+    user_names = messages.StringField(1, repeated=True)
+    difficulty = messages.StringField(2)
+    same_word = messages.BooleanField(3, default=False)
+
+
+class MakeMovesForm(messages.Message):
+    """Used to make several moves in an existing game, in order."""
+    guesses = messages.StringField(1, repeated=True)
+    expected_version = messages.IntegerField(2)
+
+
+class MoveForm(messages.Message):
+    """Outcome of one guess made through make_moves"""
+    guess = messages.StringField(1, required=True)
+    message = messages.StringField(2, required=True)
+
+
+class MovesForm(messages.Message):
+    """Outcomes of the guesses made through make_moves and the final state
+    of the game"""
+    moves = messages.MessageField(MoveForm, 1, repeated=True)
+    game = messages.MessageField(GameForm, 2, required=True)
 
 
 class ScoreForm(messages.Message):
@@ -191,6 +1166,7 @@ class ScoreForm(messages.Message):
     won = messages.BooleanField(3, required=True)
     guesses = messages.IntegerField(4, required=True)
     points = messages.IntegerField(5, required=True)
+    word = messages.StringField(6)
 
 
 class ScoreForms(messages.Message):
@@ -203,8 +1179,10 @@ class RankForm(messages.Message):
     total_played = messages.IntegerField(2, required=True)
     total_score = messages.IntegerField(3, required=True)
     average_score = messages.FloatField(4, required=True)
+    rank = messages.IntegerField(5)
 
 
 class RankForms(messages.Message):
     """Multiple Rank Forms"""
     items = messages.MessageField(RankForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
@@ -0,0 +1,192 @@
+"""simulate.py - Plays or replays hangman games offline with the game engine,
+spread over several processes, and reports games/sec with the distribution
+of points scored. Has no App Engine dependencies, like solver.py.
+
+Play N games against a word list, one word per line:
+
+    python simulate.py words.txt --games 100000 --strategy solver
+
+Replay the moves of finished games from the /admin/export/game NDJSON, for
+instance to see how a scoring change would have scored them:
+
+    python simulate.py --replay games.ndjson
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import string
+import time
+from collections import Counter
+
+import engine
+from solver import WordIndex
+
+# Letters by how often they appear in English words
+FREQUENCY_ORDER = 'ETAOINSHRDLCUMWFGYPBVKJXQZ'
+STRATEGIES = ('random', 'frequency', 'solver')
+CHUNKS_PER_PROCESS = 4
+
+# Set in each worker process by _init_worker
+_words = []
+_index = None
+
+
+def _init_worker(words, strategy):
+    global _words, _index
+    _words = words
+    _index = WordIndex(words) if strategy == 'solver' else None
+
+
+def _next_letter(state, strategy, order):
+    """Returns the next letter a player with a strategy guesses"""
+    if strategy == 'solver':
+        failed = [letter for letter in state.moves
+                  if not state.target_mask & engine.letter_bit(letter)]
+        letter, _ = _index.best_letter(state.pattern(), failed)
+        if letter:
+            return letter
+    for letter in order:
+        if not state.has_guessed(letter):
+            return letter
+
+
+def play_game(target, strategy, rng):
+    """Plays one game to the end, returning whether it was won and the
+    points scored"""
+    if strategy == 'random':
+        order = list(string.ascii_uppercase)
+        rng.shuffle(order)
+    else:
+        order = FREQUENCY_ORDER
+    state = engine.GameState(target)
+    won = None
+    while won is None:
+        _, won = engine.guess(state, _next_letter(state, strategy, order))
+    return won, engine.score(won, state.attempts_remaining)
+
+
+def replay_game(target, moves):
+    """Replays the moves of a finished game, returning whether it was won
+    and the points scored"""
+    state = engine.GameState(target)
+    won = None
+    for letter in moves:
+        _, won = engine.guess(state, letter)
+        if won is not None:
+            break
+    return won, engine.score(won, state.attempts_remaining)
+
+
+def _play_chunk(args):
+    strategy, count, seed = args
+    rng = random.Random(seed)
+    points = Counter()
+    wins = 0
+    for _ in range(count):
+        won, score = play_game(rng.choice(_words), strategy, rng)
+        wins += won
+        points[score] += 1
+    return wins, points
+
+
+def _replay_chunk(games):
+    points = Counter()
+    wins = 0
+    for target, moves in games:
+        won, score = replay_game(target, moves)
+        wins += bool(won)
+        points[score] += 1
+    return wins, points
+
+
+def _chunks(items, count):
+    size = max(1, (len(items) + count - 1) // count)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def read_words(path):
+    with open(path) as f:
+        return sorted(set(line.strip().upper() for line in f
+                          if line.strip().isalpha()))
+
+
+def read_games(path):
+    """Returns the (target, moves) of the finished games in an export"""
+    games = []
+    with open(path) as f:
+        for line in f:
+            row = json.loads(line)
+            if row.get('game_over') and row.get('target'):
+                games.append((row['target'], row.get('moves') or ''))
+    return games
+
+
+def run(pool, func, tasks):
+    """Runs the tasks on the pool and adds up their wins and points"""
+    wins = 0
+    points = Counter()
+    for chunk_wins, chunk_points in pool.imap_unordered(func, tasks):
+        wins += chunk_wins
+        points.update(chunk_points)
+    return wins, points
+
+
+def print_report(games, seconds, wins, points):
+    print('%d games in %.2fs, %.0f games/sec' % (
+        games, seconds, games / seconds if seconds else 0.0))
+    if not games:
+        return
+    total = sum(score * count for score, count in points.items())
+    print('win rate %.3f, mean points %.3f' % (
+        float(wins) / games, float(total) / games))
+    print('%6s %9s %7s' % ('points', 'games', 'share'))
+    for score in sorted(points):
+        print('%6d %9d %6.2f%%' % (score, points[score],
+                                   100.0 * points[score] / games))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('words', nargs='?',
+                        help='file with one word per line')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--strategy', choices=STRATEGIES, default='random')
+    parser.add_argument('--replay', help='NDJSON game export to replay')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.words and not args.replay:
+        parser.error('give a word list or --replay')
+
+    chunks = args.processes * CHUNKS_PER_PROCESS
+    if args.replay:
+        games = read_games(args.replay)
+        pool = multiprocessing.Pool(args.processes)
+        tasks = _chunks(games, chunks)
+        func = _replay_chunk
+        count = len(games)
+    else:
+        words = read_words(args.words)
+        if not words:
+            parser.error('no words in %s' % args.words)
+        pool = multiprocessing.Pool(args.processes, _init_worker,
+                                    (words, args.strategy))
+        sizes = [len(c) for c in _chunks(range(args.games), chunks)]
+        tasks = [(args.strategy, size, args.seed + i)
+                 for i, size in enumerate(sizes)]
+        func = _play_chunk
+        count = args.games
+    start = time.time()
+    try:
+        wins, points = run(pool, func, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    print_report(count, time.time() - start, wins, points)
+
+
+if __name__ == '__main__':
+    main()
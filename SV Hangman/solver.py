@@ -0,0 +1,120 @@
+"""solver.py - Hangman solver over an index of the target words. Words are
+grouped by length, and for each length every (position, letter) pair and
+every letter has a bitset of the words that match it, so filtering the
+candidates for a game is a handful of integer ANDs. Has no App Engine
+dependencies so it can also be run offline:
+
+    python solver.py words.txt --pattern _A__A_ --failed EIO
+"""
+
+import argparse
+import binascii
+import string
+
+
+def _bitset(indices, size):
+    """Returns an int with the bits of the given indices set"""
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    bits.reverse()
+    return int(binascii.hexlify(bits), 16) if bits else 0
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+class _LengthIndex(object):
+    """Bitsets of the words of one length"""
+    __slots__ = ('words', 'all', 'at', 'contains')
+
+    def __init__(self, words):
+        self.words = words
+        size = len(words)
+        self.all = (1 << size) - 1
+        at = {}
+        contains = {}
+        for i, word in enumerate(words):
+            for position, letter in enumerate(word):
+                at.setdefault((position, letter), []).append(i)
+                contains.setdefault(letter, set()).add(i)
+        self.at = dict((key, _bitset(indices, size))
+                       for key, indices in at.items())
+        self.contains = dict((letter, _bitset(indices, size))
+                             for letter, indices in contains.items())
+
+
+class WordIndex(object):
+    """Index of uppercase words for filtering hangman candidates"""
+
+    def __init__(self, words):
+        by_length = {}
+        for word in set(words):
+            by_length.setdefault(len(word), []).append(word)
+        self.lengths = dict((length, _LengthIndex(sorted(group)))
+                            for length, group in by_length.items())
+
+    def _candidates(self, pattern, failed):
+        """Returns the length index and the bitset of the words matching a
+        pattern of revealed letters and '_', that contain none of the failed
+        letters"""
+        index = self.lengths.get(len(pattern))
+        if index is None:
+            return None, 0
+        bits = index.all
+        revealed = set(letter for letter in pattern if letter != '_')
+        for position, letter in enumerate(pattern):
+            if letter == '_':
+                # A hidden position cannot hold a letter already revealed
+                for guessed in revealed:
+                    bits &= ~index.at.get((position, guessed), 0)
+            else:
+                bits &= index.at.get((position, letter), 0)
+        for letter in failed:
+            bits &= ~index.contains.get(letter, 0)
+        return index, bits
+
+    def candidates(self, pattern, failed=()):
+        """Returns the list of words that fit a game"""
+        index, bits = self._candidates(pattern, failed)
+        if not bits:
+            return []
+        return [word for i, word in enumerate(index.words) if bits >> i & 1]
+
+    def best_letter(self, pattern, failed=()):
+        """Returns the unguessed letter found in the most candidate words
+        and the number of candidates, or (None, 0) if no word fits"""
+        index, bits = self._candidates(pattern, failed)
+        if not bits:
+            return None, 0
+        guessed = set(pattern) | set(failed)
+        best, best_count = None, -1
+        for letter in string.ascii_uppercase:
+            if letter in guessed:
+                continue
+            count = _popcount(bits & index.contains.get(letter, 0))
+            if count > best_count:
+                best, best_count = letter, count
+        return best, _popcount(bits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggest a hangman guess')
+    parser.add_argument('words', help='file with one word per line')
+    parser.add_argument('--pattern', required=True,
+                        help="revealed letters with '_' for hidden ones")
+    parser.add_argument('--failed', default='', help='letters guessed wrong')
+    args = parser.parse_args()
+    with open(args.words) as f:
+        index = WordIndex(line.strip().upper() for line in f if line.strip())
+    pattern = args.pattern.upper()
+    failed = args.failed.upper()
+    letter, count = index.best_letter(pattern, failed)
+    print('%s (%d candidates)' % (letter, count))
+    for word in index.candidates(pattern, failed)[:20]:
+        print(word)
+
+
+if __name__ == '__main__':
+    main()
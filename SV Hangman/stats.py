@@ -0,0 +1,151 @@
+"""stats.py - Per-endpoint latency, datastore RPC and cache hit counters.
+Functions wrapped with instrument() record into in-process counters that are
+added to shared memcache counters at most once every FLUSH_INTERVAL seconds.
+Stats are only collected when the HANGMAN_STATS environment variable is set
+to 1 in app.yaml; otherwise instrument() returns the function unchanged."""
+
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+from google.appengine.api import apiproxy_stub_map, memcache
+
+ENABLED = os.environ.get('HANGMAN_STATS') == '1'
+FLUSH_INTERVAL = 60
+MEMCACHE_PREFIX = 'stats:'
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+RPC_FIELDS = {
+    ('datastore_v3', 'Get'): 'datastore_get',
+    ('datastore_v3', 'Put'): 'datastore_put',
+    ('datastore_v3', 'Delete'): 'datastore_delete',
+    ('datastore_v3', 'RunQuery'): 'datastore_query',
+    ('datastore_v3', 'Next'): 'datastore_query',
+    ('datastore_v3', 'Commit'): 'datastore_commit',
+}
+
+# Names of all instrumented functions, in the order they were wrapped
+NAMES = []
+
+_counters = defaultdict(int)
+_lock = threading.Lock()
+_active = threading.local()
+_last_flush = [time.time()]
+
+
+def latency_bucket(ms):
+    """Returns the histogram field for a latency"""
+    for bound in LATENCY_BUCKETS:
+        if ms <= bound:
+            return 'le_%d_ms' % bound
+    return 'gt_%d_ms' % LATENCY_BUCKETS[-1]
+
+
+def fields():
+    """Returns every field recorded for a name, in display order"""
+    return (['calls', 'total_ms'] +
+            [latency_bucket(bound) for bound in LATENCY_BUCKETS] +
+            [latency_bucket(LATENCY_BUCKETS[-1] + 1)] +
+            sorted(set(RPC_FIELDS.values())) +
+            ['cache_hit', 'cache_miss'])
+
+
+def _frames():
+    frames = getattr(_active, 'frames', None)
+    if frames is None:
+        frames = _active.frames = []
+    return frames
+
+
+def _count(field, amount=1):
+    """Adds to a field of every instrumented call active on this thread"""
+    frames = _frames()
+    if not frames:
+        return
+    with _lock:
+        for name in frames:
+            _counters[(name, field)] += amount
+
+
+def _rpc_hook(service, call, request, response):
+    field = RPC_FIELDS.get((service, call))
+    if field:
+        _count(field)
+
+
+def record_cache(hit):
+    """Records a cache hit or miss against the active instrumented calls"""
+    if ENABLED:
+        _count('cache_hit' if hit else 'cache_miss')
+
+
+def instrument(func):
+    """Decorator recording the wall time, datastore RPCs and cache hits of
+    each call to func under its name"""
+    if not ENABLED:
+        return func
+    name = func.__name__
+    if name not in NAMES:
+        NAMES.append(name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frames = _frames()
+        frames.append(name)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ms = (time.time() - start) * 1000
+            frames.pop()
+            with _lock:
+                _counters[(name, 'calls')] += 1
+                _counters[(name, 'total_ms')] += int(ms)
+                _counters[(name, latency_bucket(ms))] += 1
+            if not frames:
+                maybe_flush()
+    return wrapper
+
+
+def maybe_flush():
+    """Flushes the counters if FLUSH_INTERVAL has passed since the last
+    flush on this instance"""
+    if time.time() - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Adds this instance's counters to the memcache counters and resets
+    them"""
+    with _lock:
+        counters = dict(_counters)
+        _counters.clear()
+        _last_flush[0] = time.time()
+    if counters:
+        memcache.offset_multi(
+            dict(('%s%s:%s' % (MEMCACHE_PREFIX, name, field), amount)
+                 for (name, field), amount in counters.items()),
+            initial_value=0)
+
+
+def read():
+    """Returns the flushed counters as a dict of name to a dict of field to
+    count, with the cache hit ratio added"""
+    keys = ['%s:%s' % (name, field) for name in NAMES for field in fields()]
+    values = memcache.get_multi(keys, key_prefix=MEMCACHE_PREFIX)
+    result = {}
+    for name in NAMES:
+        counts = dict((field, values.get('%s:%s' % (name, field), 0))
+                      for field in fields())
+        lookups = counts['cache_hit'] + counts['cache_miss']
+        counts['cache_hit_ratio'] = (float(counts['cache_hit']) / lookups
+                                     if lookups else None)
+        result[name] = counts
+    return result
+
+
+if ENABLED:
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'hangman_stats', _rpc_hook, 'datastore_v3')
@@ -0,0 +1,357 @@
+"""test_api.py - Tests of the API endpoints against the App Engine testbed.
+Needs the App Engine Python SDK, found through the APPENGINE_SDK environment
+variable:
+
+    APPENGINE_SDK=~/google-cloud-sdk/platform/google_appengine \
+        python -m unittest discover -p 'test_*.py'
+"""
+
+import os
+import sys
+import unittest
+
+
+def setup_sdk():
+    """Puts the App Engine SDK and its bundled libraries on sys.path"""
+    sdk_path = os.environ.get('APPENGINE_SDK')
+    if sdk_path and sdk_path not in sys.path:
+        sys.path.insert(0, sdk_path)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+setup_sdk()
+
+from google.appengine.datastore import datastore_stub_util  # noqa: E402
+from google.appengine.ext import ndb, testbed  # noqa: E402
+
+
+class HangmanTestCase(unittest.TestCase):
+    """Runs each test against fresh datastore, memcache, task queue and
+    mail stubs, with the API service and a few words and users"""
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        # endpoints reads the app revision from the version id
+        self.testbed.setup_env(current_version_id='test.1', overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=os.path.dirname(
+            os.path.abspath(__file__)))
+        self.testbed.init_mail_stub()
+        self.testbed.init_app_identity_stub()
+        ndb.get_context().clear_cache()
+
+        import api
+        import models
+        self.api = api
+        self.service = api.SVHangmanAPI()
+        models._word_pool.update(version=None, words=[])
+        models._word_index.update(version=None, index=None)
+        models._difficulty_pool.update(expires=0, words={})
+        models._migrations_done.clear()
+        models.Word.add_words(['KIWI'])
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def call(self, name, container, **fields):
+        """Calls an endpoint method with a request built from fields"""
+        return getattr(self.service, name)(
+            container.combined_message_class(**fields))
+
+    def create_user(self, name):
+        self.call('create_user', self.api.USER_REQUEST, user_name=name,
+                  email='%s@example.com' % name)
+
+    def new_game(self, name):
+        return self.call('new_game', self.api.NEW_GAME_REQUEST,
+                         user_name=name)
+
+    def play(self, game, letters):
+        """Guesses letters one at a time, returning the last GameForm"""
+        for letter in letters:
+            game = self.call('make_move', self.api.MAKE_MOVE_REQUEST,
+                             urlsafe_key=game.urlsafe_key, guess=letter)
+        return game
+
+
+class UserNameTest(HangmanTestCase):
+    def test_missing_or_blank_names_have_no_user(self):
+        import endpoints
+        from models import User
+        self.create_user('alice')
+        for name in (None, '', '  '):
+            self.assertIsNone(User.get_key_by_name(name))
+            self.assertRaises(endpoints.NotFoundException, self.new_game,
+                              name)
+            self.assertRaises(endpoints.NotFoundException, self.call,
+                              'get_user_games', self.api.USER_REQUEST,
+                              user_name=name)
+            self.assertRaises(endpoints.BadRequestException,
+                              self.create_user, name)
+        self.assertEqual(User.get_keys_by_names([None, 'alice']),
+                         {None: None, 'alice': User.get_key_by_name('alice')})
+
+
+class EndGameTest(HangmanTestCase):
+    def test_win_is_scored_and_added_to_leaderboard(self):
+        from models import Leaderboard, User
+        self.create_user('alice')
+        game = self.play(self.new_game('alice'), 'KIW')
+        self.assertTrue(game.game_over)
+        self.assertEqual(game.message, 'You Won!!')
+        user = User.get_by_name('alice')
+        self.assertEqual((user.wins, user.total_score), (1, 10))
+        board = Leaderboard.get_by_id('all_time')
+        self.assertEqual([(e.user_name, e.points) for e in board.entries],
+                         [('alice', 10)])
+
+    def test_loss_ends_game(self):
+        self.create_user('bob')
+        game = self.play(self.new_game('bob'), 'ABCDEFG')
+        self.assertTrue(game.game_over)
+        self.assertEqual(game.attempts_remaining, 0)
+        self.assertEqual(game.message, 'Game Over! The word was: KIWI')
+
+
+class MakeMoveTest(HangmanTestCase):
+    def test_game_deleted_after_cache_read_is_not_found(self):
+        import endpoints
+        from google.appengine.ext import ndb
+        self.create_user('alice')
+        game = self.new_game('alice')
+        # Delete the stored game only, leaving the cached copy
+        ndb.Key(urlsafe=game.urlsafe_key).delete()
+        self.assertRaises(endpoints.NotFoundException, self.play, game, 'K')
+
+    def move(self, game, guess, version):
+        return self.call('make_move', self.api.MAKE_MOVE_REQUEST,
+                         urlsafe_key=game.urlsafe_key, guess=guess,
+                         expected_version=version)
+
+    def test_replayed_move_is_not_applied_again(self):
+        self.create_user('alice')
+        game = self.new_game('alice')
+        played = self.move(game, 'A', 0)
+        self.assertEqual(played.attempts_remaining, 6)
+        replayed = self.move(game, 'A', 0)
+        self.assertEqual(replayed.message, 'Move already applied.')
+        self.assertEqual((replayed.attempts_remaining, replayed.version),
+                         (6, played.version))
+
+    def test_replayed_winning_moves_count_once(self):
+        from models import User
+        self.create_user('alice')
+        game = self.new_game('alice')
+        for _ in range(2):
+            moves = self.call('make_moves', self.api.MAKE_MOVES_REQUEST,
+                              urlsafe_key=game.urlsafe_key,
+                              guesses=['K', 'I', 'W'], expected_version=0)
+        self.assertEqual([m.message for m in moves.moves],
+                         ['Move already applied.'] * 3)
+        self.assertTrue(moves.game.game_over)
+        user = User.get_by_name('alice')
+        self.assertEqual((user.wins, user.total_played, user.total_score),
+                         (1, 1, 10))
+
+    def test_stale_or_future_version_conflicts(self):
+        import endpoints
+        self.create_user('alice')
+        game = self.new_game('alice')
+        self.move(game, 'A', 0)
+        self.assertRaises(endpoints.ConflictException, self.move, game, 'B',
+                          0)
+        self.assertRaises(endpoints.ConflictException, self.move, game, 'B',
+                          5)
+        self.assertEqual(self.move(game, 'B', 1).attempts_remaining, 5)
+
+
+class MakeMovesTest(HangmanTestCase):
+    def test_moves_stop_at_the_winning_guess(self):
+        from models import Score, User
+        self.create_user('alice')
+        game = self.new_game('alice')
+        moves = self.call('make_moves', self.api.MAKE_MOVES_REQUEST,
+                          urlsafe_key=game.urlsafe_key,
+                          guesses=['K', 'I', 'W', 'A', 'B'])
+        self.assertEqual([(m.guess, m.message) for m in moves.moves],
+                         [('K', 'You guessed correct!'),
+                          ('I', 'You guessed correct!'),
+                          ('W', 'You Won!!')])
+        self.assertTrue(moves.game.game_over)
+        self.assertEqual(moves.game.attempts_remaining, 7)
+        user = User.get_by_name('alice')
+        self.assertEqual((user.wins, user.total_played), (1, 1))
+        self.assertEqual(Score.query().count(), 1)
+
+
+class NewGamesTest(HangmanTestCase):
+    def new_games(self, names):
+        return self.service.new_games(self.api.NewGamesForm(user_names=names))
+
+    def test_games_follow_the_order_of_the_names(self):
+        for name in ('alice', 'bob', 'carol'):
+            self.create_user(name)
+        games = self.new_games(['carol', 'alice', 'bob', 'alice'])
+        self.assertEqual([g.user_name for g in games.items],
+                         ['carol', 'alice', 'bob', 'alice'])
+        self.assertEqual(len(set(g.urlsafe_key for g in games.items)), 4)
+
+    def test_unknown_names_are_rejected(self):
+        import endpoints
+        from models import Game
+        self.create_user('alice')
+        with self.assertRaises(endpoints.NotFoundException) as raised:
+            self.new_games(['zed', 'alice', 'yan'])
+        self.assertEqual(str(raised.exception),
+                         'No Users with the names: yan, zed')
+        self.assertEqual(Game.query().count(), 0)
+
+
+class HintTest(HangmanTestCase):
+    def hint(self, game):
+        hint = self.call('get_hint', self.api.GET_GAME_REQUEST,
+                         urlsafe_key=game.urlsafe_key)
+        return hint.letter, hint.candidates
+
+    def test_hint_follows_added_words_and_guesses(self):
+        from models import Word
+        self.create_user('alice')
+        game = self.new_game('alice')
+        self.assertEqual(self.hint(game)[1], 1)
+        Word.add_words(['KILN', 'KIND', 'PLUM', 'FIGS'])
+        self.assertEqual(self.hint(game)[1], 5)
+        self.play(game, 'K')
+        self.assertEqual(self.hint(game), ('I', 3))
+        # A failed N rules out KILN and KIND
+        self.play(game, 'N')
+        self.assertEqual(self.hint(game), ('I', 1))
+
+
+class GameSummaryTest(HangmanTestCase):
+    def test_summaries_of_active_and_completed_games(self):
+        self.create_user('alice')
+        self.play(self.new_game('alice'), 'K')
+        self.play(self.new_game('alice'), 'KIW')
+        active = self.call('get_user_game_summaries',
+                           self.api.SUMMARY_REQUEST, user_name='alice')
+        self.assertEqual([(s.letters_revealed, s.target_length, s.game_over)
+                          for s in active.items], [(1, 4, False)])
+        completed = self.call('get_user_game_summaries',
+                              self.api.SUMMARY_REQUEST, user_name='alice',
+                              completed=True)
+        self.assertEqual([(s.letters_revealed, s.game_over)
+                          for s in completed.items], [(4, True)])
+
+
+class LeaderboardTest(HangmanTestCase):
+    def test_period_boards_hold_todays_scores(self):
+        self.create_user('alice')
+        self.play(self.new_game('alice'), 'KIW')
+        for period in ('daily', 'weekly'):
+            scores = self.call('get_high_scores', self.api.HIGH_SCORE_REQUEST,
+                               period=period)
+            self.assertEqual([(s.user_name, s.points) for s in scores.items],
+                             [('alice', 10)])
+
+    def test_first_board_includes_earlier_scores(self):
+        from datetime import date
+        from models import Score, User
+        self.create_user('bob')
+        bob = User.get_key_by_name('bob')
+        for points in (9, 8, 7):
+            Score(user=bob, date=date.today(), won=True, guesses=points - 3,
+                  points=points, word='KIWI').put()
+        self.create_user('alice')
+        self.play(self.new_game('alice'), 'KIW')
+        scores = self.call('get_high_scores', self.api.HIGH_SCORE_REQUEST)
+        self.assertEqual([(s.user_name, s.points) for s in scores.items],
+                         [('alice', 10), ('bob', 9), ('bob', 8), ('bob', 7)])
+
+    def test_expiry_keeps_all_time_board(self):
+        from datetime import date, timedelta
+        from models import Leaderboard
+        self.create_user('alice')
+        self.play(self.new_game('alice'), 'KIW')
+        Leaderboard(id='daily:old',
+                    expires=date.today() - timedelta(days=1)).put()
+        Leaderboard.delete_expired()
+        self.assertIsNone(Leaderboard.get_by_id('daily:old'))
+        self.assertIsNotNone(Leaderboard.get_by_id('all_time'))
+
+
+class WordStatsTest(HangmanTestCase):
+    def test_results_rate_word_difficulty(self):
+        from models import MIN_DIFFICULTY_PLAYS, WordStats
+        from models import rebuild_difficulty_pool
+        self.create_user('alice')
+        for _ in range(MIN_DIFFICULTY_PLAYS):
+            self.play(self.new_game('alice'), 'KIW')
+        stats = WordStats.get_by_id('KIWI')
+        self.assertEqual((stats.plays, stats.wins), (MIN_DIFFICULTY_PLAYS,
+                                                     MIN_DIFFICULTY_PLAYS))
+        self.assertEqual(rebuild_difficulty_pool(),
+                         {'easy': ['KIWI'], 'medium': [], 'hard': []})
+
+
+class GlobalStatsTest(HangmanTestCase):
+    def get_stats(self):
+        from protorpc import message_types
+        stats = self.service.get_global_stats(message_types.VoidMessage())
+        return (stats.games_started, stats.games_finished, stats.games_won,
+                stats.total_points)
+
+    def test_counts_games_and_results(self):
+        from google.appengine.api import memcache
+        self.create_user('alice')
+        won = self.new_game('alice')
+        lost = self.new_game('alice')
+        self.assertEqual(self.get_stats(), (2, 0, 0, 0))
+        self.play(won, 'KIW')
+        self.play(lost, 'ABCDEFG')
+        # Once from the cached totals, once summed from the shards
+        self.assertEqual(self.get_stats(), (2, 2, 1, 10))
+        memcache.flush_all()
+        self.assertEqual(self.get_stats(), (2, 2, 1, 10))
+
+
+class RankTest(HangmanTestCase):
+    def test_rank_follows_average_score(self):
+        self.create_user('alice')
+        self.create_user('bob')
+        self.play(self.new_game('bob'), 'ABCDEFG')
+        self.play(self.new_game('alice'), 'KIW')
+        ranks = dict((name, self.call('get_user_rank', self.api.USER_REQUEST,
+                                      user_name=name).rank)
+                     for name in ('alice', 'bob'))
+        self.assertEqual(ranks, {'alice': 1, 'bob': 2})
+
+    def test_rebuild_counts_existing_users(self):
+        from models import RankerShard, User
+        self.create_user('alice')
+        self.create_user('bob')
+        user = User.get_by_name('alice')
+        user.average_score = 5.0
+        user.put()
+        self.assertEqual(RankerShard.get_rank(1.0), 1)
+        RankerShard.rebuild()
+        self.assertEqual(RankerShard.get_rank(1.0), 2)
+
+
+class AddWordTest(HangmanTestCase):
+    def test_word_with_trailing_newline_is_rejected(self):
+        import endpoints
+        from models import Word
+        self.assertFalse(Word.is_valid('KIWI\n'))
+        self.assertRaises(endpoints.BadRequestException,
+                          self.service.add_word,
+                          self.api.WordForm(word='plum\n'))
+        self.assertIsNone(Word.get_by_id('PLUM\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
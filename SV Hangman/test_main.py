@@ -0,0 +1,107 @@
+"""test_main.py - Tests of the cron and task handlers against the App Engine
+testbed, see test_api.py for how to run them."""
+
+import unittest
+
+# test_api puts the SDK on sys.path, so it is imported first
+from test_api import HangmanTestCase
+
+import webapp2  # noqa: E402
+
+
+class HandlerTestCase(HangmanTestCase):
+    def setUp(self):
+        super(HandlerTestCase, self).setUp()
+        from google.appengine.ext import testbed
+        import main
+        self.app = main.app
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        self.mail = self.testbed.get_stub(testbed.MAIL_SERVICE_NAME)
+
+    def request(self, url, method='GET', params=None):
+        """Sends a request to the handlers and returns the response"""
+        request = webapp2.Request.blank(url, POST=params)
+        request.method = method
+        response = request.get_response(self.app)
+        self.assertEqual(response.status_int, 200, response.body)
+        return response
+
+    def run_tasks(self, queue):
+        """Runs the tasks queued so far, and the ones they queue, in order"""
+        while True:
+            tasks = self.taskqueue.get_filtered_tasks(queue_names=[queue])
+            if not tasks:
+                return
+            self.taskqueue.FlushQueue(queue)
+            for task in tasks:
+                self.request(task.url, task.method, task.extract_params())
+
+
+class ReminderTest(HandlerTestCase):
+    def test_users_with_unfinished_games_are_mailed(self):
+        self.create_user('alice')
+        self.create_user('bob')
+        self.create_user('carol')
+        self.new_game('alice')
+        self.new_game('alice')
+        self.play(self.new_game('bob'), 'KIW')
+        self.request('/crons/send_reminder')
+        self.run_tasks('reminders')
+        messages = self.mail.get_sent_messages()
+        self.assertEqual([m.to for m in messages], ['alice@example.com'])
+
+
+class ArchiveGamesTest(HandlerTestCase):
+    def test_ended_games_move_to_the_archive(self):
+        from models import Game
+        self.create_user('alice')
+        self.play(self.new_game('alice'), 'KIW')
+        active = self.new_game('alice')
+        self.request('/crons/archive_games?days=0')
+        self.run_tasks('default')
+        self.assertEqual([g.key.urlsafe() for g in Game.query()],
+                         [active.urlsafe_key])
+        archived = self.call('get_user_games_archived',
+                             self.api.ARCHIVE_REQUEST, user_name='alice')
+        self.assertEqual([(g.user_name, g.target, g.attempts_remaining,
+                           g.won) for g in archived.items],
+                         [('alice', 'KIWI', 7, True)])
+        self.assertIsNone(archived.next_cursor)
+
+
+class MigrateUserNamesTest(HandlerTestCase):
+    def test_lookup_stops_querying_once_migrated(self):
+        from models import Migration, User, USER_NAME_MIGRATION
+        User(name='Alice', email='alice@example.com').put()
+        self.request('/crons/migrate_user_names')
+        self.assertIsNotNone(Migration.get_by_id(USER_NAME_MIGRATION))
+        self.assertIsNotNone(User.get_key_by_name('alice'))
+        # A user without a UserName is no longer found by query
+        User(name='Bob', email='bob@example.com').put()
+        self.assertIsNone(User.get_key_by_name('Bob'))
+
+    def test_legacy_user_found_before_migration(self):
+        from models import User, UserName
+        User(name='Bob', email='bob@example.com').put()
+        self.assertIsNotNone(User.get_key_by_name('Bob'))
+        self.assertIsNotNone(UserName.get_by_id('bob'))
+
+
+class MigrateWordsTest(HandlerTestCase):
+    def test_add_word_stops_querying_once_migrated(self):
+        import endpoints
+        from models import Migration, Word, WORD_MIGRATION
+        Word(word='plum', word_list=list('PLUM')).put()
+        # Before the migration an old word is found whatever its case
+        self.assertRaises(endpoints.ConflictException, self.service.add_word,
+                          self.api.WordForm(word='Plum'))
+        self.request('/crons/migrate_words')
+        self.assertIsNotNone(Migration.get_by_id(WORD_MIGRATION))
+        self.assertIsNotNone(Word.get_by_id('PLUM'))
+        # A word with a numeric id is no longer found by query
+        Word(word='fig', word_list=list('FIG')).put()
+        self.assertFalse(Word.exists('FIG'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""test_models.py - Tests of the models against the App Engine testbed, see
+test_api.py for how to run them."""
+
+import unittest
+
+from test_api import HangmanTestCase
+
+
+class WordPoolTest(HangmanTestCase):
+    def setUp(self):
+        super(WordPoolTest, self).setUp()
+        import models
+        self.models = models
+
+    def reload_pool(self):
+        """Drops this instance's copy of the pool so it is read again"""
+        self.models._word_pool.update(version=None, words=[])
+        return self.models.get_word_pool()
+
+    def test_large_pool_is_split_across_memcache_keys(self):
+        from google.appengine.api import memcache
+        words = ['%sWORD' % ''.join(chr(ord('A') + int(d)) for d in '%06d' % i)
+                 for i in range(70000)]
+        self.assertRaises(ValueError, memcache.set, 'words', words)
+        memcache.set(self.models.WORD_POOL_VERSION_KEY, 1)
+        self.models._write_word_pool(1, 1, self.models._chunk_words(words))
+        self.assertEqual(memcache.get(self.models.WORD_POOL_KEY), (1, 1, 7))
+        self.assertEqual(self.reload_pool(), words)
+        # A chunk over the limit is logged and leaves the header alone
+        self.models._write_word_pool(2, 2, [words])
+        self.assertEqual(memcache.get(self.models.WORD_POOL_KEY), (1, 1, 7))
+
+    def test_added_words_extend_last_chunk(self):
+        self.models.WORD_POOL_CHUNK_SIZE = 2
+        try:
+            self.models.get_word_pool()
+            self.models.Word.add_words(['APPLE', 'PEAR'])
+            self.models.Word.add_words(['PLUM', 'FIG'])
+            self.assertEqual(sorted(self.reload_pool()),
+                             ['APPLE', 'FIG', 'KIWI', 'PEAR', 'PLUM'])
+            self.assertEqual(self.models._read_word_pool()[2],
+                             [['KIWI', 'APPLE'], ['PEAR', 'PLUM'], ['FIG']])
+        finally:
+            self.models.WORD_POOL_CHUNK_SIZE = 10000
+
+    def test_rebuild_keeps_words_the_query_missed(self):
+        self.models.get_word_pool()
+        # Stands in for a word put but not yet seen by the query
+        self.models.add_to_word_pool(['PLUM'])
+        self.models.rebuild_word_pool()
+        self.assertEqual(sorted(self.reload_pool()), ['KIWI', 'PLUM'])
+
+
+class AddWordsTest(HangmanTestCase):
+    def test_new_words_added_to_pool_once(self):
+        import models
+        calls = []
+        add_to_word_pool = models.add_to_word_pool
+        models.add_to_word_pool = calls.append
+        models.WORD_CHUNK_SIZE = 2
+        try:
+            self.assertEqual(models.Word.add_words(
+                ['APPLE', 'KIWI', 'PEAR', 'PLUM', 'FIG']), (4, 1, 0))
+        finally:
+            models.add_to_word_pool = add_to_word_pool
+            models.WORD_CHUNK_SIZE = 500
+        self.assertEqual(calls, [['APPLE', 'PEAR', 'PLUM', 'FIG']])
+
+
+class DifficultyPoolTest(HangmanTestCase):
+    def test_pool_only_read_for_a_difficulty(self):
+        from google.appengine.api import memcache
+        self.create_user('alice')
+        self.new_game('alice')
+        self.assertIsNone(memcache.get('difficulty_pool'))
+        self.call('new_game', self.api.NEW_GAME_REQUEST, user_name='alice',
+                  difficulty='easy')
+        self.assertIsNotNone(memcache.get('difficulty_pool'))
+
+    def test_pool_too_large_for_memcache_is_served_uncached(self):
+        import models
+
+        def set_too_large(*args, **kwargs):
+            raise ValueError('Values may not be more than 1000000 bytes')
+        memcache_set = models.memcache.set
+        models.memcache.set = set_too_large
+        try:
+            self.assertEqual(models.get_difficulty_pool(),
+                             {'easy': [], 'medium': [], 'hard': []})
+        finally:
+            models.memcache.set = memcache_set
+
+
+class GameMigrationTest(HangmanTestCase):
+    def test_projection_query_skips_migration(self):
+        from models import Game
+        self.create_user('alice')
+        self.new_game('alice')
+        games = Game.query(projection=[Game.user], distinct=True).fetch()
+        self.assertEqual(len(games), 1)
+        self.assertFalse(games[0].migrated)
+
+
+if __name__ == '__main__':
+    unittest.main()
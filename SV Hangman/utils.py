@@ -1,19 +1,29 @@
 """utils.py - File for collecting general utitlity functions"""
 
 
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 import endpoints
 
+from cache import get_entity
+from stats import instrument
 
-def get_by_urlsafe(urlsafe, model):
+
+@instrument
+def get_by_urlsafe(urlsafe, model, for_update=False):
     """Returns an ndb.Model entity that the urlsafe key points to. Checks
         that the type of entity returned is of the correct kind. Raises an
         error if the key String is malformed or if the entity is of the
         incorrect kind.
 
+        Models that set _use_entity_cache are read through the entity
+        cache.
+
         Args:
             urlsafe: A urlsafe key string.
             model: The expected entity kind
+            for_update: True if the entity will be written back, see
+                cache.get_entity.
 
         Returns:
             The entity that the urlsafe key string points to or None if no
@@ -30,10 +40,27 @@ def get_by_urlsafe(urlsafe, model):
             raise endpoints.BadRequestException('Invalid Key.')
         else:
             raise
-    entity = key.get()
+    if getattr(model, '_use_entity_cache', False):
+        entity = get_entity(key, for_update)
+    else:
+        entity = key.get()
     if not entity:
         return None
     if not isinstance(entity, model):
         raise ValueError('Incorrect Kind')
 
     return entity
+
+
+def get_cursor(urlsafe):
+    """Returns a query Cursor for a urlsafe cursor string, or None if the
+        string is empty.
+
+        Raises:
+            endpoints.BadRequestException if the string is malformed."""
+    if not urlsafe:
+        return None
+    try:
+        return Cursor(urlsafe=urlsafe)
+    except Exception:
+        raise endpoints.BadRequestException('Invalid Cursor.')